@@ -1,48 +1,30 @@
-import plotly.express as px
+import os
 import dash
 import dash_bootstrap_components as dbc
 import plotly.io as pio
-from dash import html, dcc, Input, Output
+from dash import html, dcc, Input, Output, State
 from app import app
-from dashboard_functions import data_reader, unique_states_and_cols, heatmap_generator, aggregated_stats_generator
+from data_clean.data_cleaning import national_aggregate
+from dashboard_functions import unique_states_and_cols, heatmap_figure_generator, heatmap_frame_generator, aggregated_stats_generator, national_reader, state_series_generator, line_plot_generator
+from data_store import store
+from figure_cache import FigureCache
+from figure_assets import render_figure_asset, serve_figure_asset
 pio.templates.default = 'none'
 
 
-# Read in data
-df = data_reader()
+# State comparison figures shared by both plots and every user, keyed on (sorted states, column)
+line_plot_cache = FigureCache(max_bytes = int(os.environ.get('FIGURE_CACHE_BYTES', 32 * 1024 * 1024)))
 
+# Overview heatmaps: (name, column, title)
+# 'prerendered' serves every animation frame as one cached json file, 'lazy' sends the latest date
+# and fetches other dates from the server as the slider moves
+HEATMAPS = [
+    ('incident-rates', 'Incident_Rate', 'Incident Rates Across The US'),
+    ('confirmed-cases', 'Confirmed', 'Confirmed Case Counts Across The US')
+]
+HEATMAP_MODE = os.environ.get('HEATMAP_MODE', 'prerendered')
+heatmap_frame_cache = FigureCache(max_bytes = int(os.environ.get('HEATMAP_FRAME_CACHE_BYTES', 32 * 1024 * 1024)))
 
-# Dropdowns
-# State Comparisons Dropdowns: States, Col1, Col2
-unique_states, unique_cols = unique_states_and_cols(df)
-
-states_dropdown = dcc.Dropdown(
-    id = 'states-dropdown',
-    options = [{'label': state, 'value': state} for state in unique_states],
-    value = ['California', 'New York'],
-    multi = True
-)
-
-column_dropdown1 = dcc.Dropdown(
-    id = 'col-dropdown1',
-    options = [{'label': col, 'value': col} for col in unique_cols],
-    value = 'Confirmed',
-)
-
-column_dropdown2 = dcc.Dropdown(
-    id = 'col-dropdown2',
-    options = [{'label': col, 'value': col} for col in unique_cols],
-    value = 'Deaths',
-)
-
-
-# Plots
-# Overview Heatmaps
-incident_rates_heatmap = heatmap_generator(df, df_column = 'Incident_Rate', plot_title = 'Incident Rates Across The US')
-confirmed_cases_heatmap = heatmap_generator(df, df_column = 'Confirmed', plot_title = 'Confirmed Case Counts Across The US')
-
-# Aggregated Stats Scatter Plots
-aggregated_stats = aggregated_stats_generator(df, unique_cols)
 
 # State Comparison Line Plots
 fig_1 = dcc.Graph(
@@ -55,198 +37,469 @@ fig_2 = dcc.Graph(
     figure = {}
 )
 
+# Changes sent by the server for each plot, and the states/column each plot currently shows
+fig_stores = [
+    dcc.Store(id = 'fig-{}-update'.format(n)) for n in (1, 2)
+] + [
+    dcc.Store(id = 'fig-{}-shown'.format(n)) for n in (1, 2)
+]
 
-# Callbacks to update graphs
-# Callbacks for fig-1, fig-2
-@app.callback(
-    [
-        Output(component_id='fig-1', component_property='figure'),
-        Output(component_id='fig-2', component_property='figure'),
-
-    ],
-    [
-        Input(component_id='states-dropdown', component_property='value'),
-        Input(component_id='col-dropdown1', component_property='value'),
-        Input(component_id='col-dropdown2', component_property='value')
-    ]
-)
-def update_confirmed_cases(states_chosen, col_chosen1, col_chosen2):
-    if (len(states_chosen) > 0) and (col_chosen1 is not None) and (col_chosen2 is not None):
-        tmp_df = df[df['Province_State'].isin(states_chosen)]
-
-        fig1 = px.line(
-            data_frame = tmp_df,
-            x = 'Date',
-            y = col_chosen1,
-            color = 'Province_State',
-            log_y = True,
-            title = '(Log) {} Counts'.format(col_chosen1)
-        )
-        
-        fig1.update_layout(
-            title = {'x': 0.5},
-            xaxis = {'title': 'Date'},
-            yaxis = {'title': 'Counts'},
-            legend = {'title': 'State'},
-        )
-
-        fig1.update_xaxes(
-            rangeslider_visible=True,
-            rangeselector=dict(
-                buttons=list([
-                    dict(count=3, label="3m", step="month", stepmode="backward"),
-                    dict(count=6, label="6m", step="month", stepmode="backward"),
-                    dict(count=1, label="YTD", step="year", stepmode="todate"),
-                    dict(count=1, label="1y", step="year", stepmode="backward"),
-                    dict(step="all")
-                ])
-            )
-        )
 
+# Callbacks to update graphs
+def update_state_comparison(states_chosen, col_chosen, shown):
+    '''
+    Work out the smallest change that brings a state comparison plot up to date
+    A new column or data version resends the whole figure, while adding or removing states
+    only sends the added traces and the names of the removed ones
+
+    Parameters:
+    -----------
+    states_chosen: list of state names
+    col_chosen: str
+    shown: dict of the states, column and data version the plot currently shows
+
+    Returns:
+    update: dict with either a full figure or traces to add and remove
+    shown: dict of what the plot shows after the update
+    '''
+
+    if (not states_chosen) or (col_chosen is None):
+        raise dash.exceptions.PreventUpdate
 
-        fig2 = px.line(
-            data_frame = tmp_df,
-            x = 'Date',
-            y = col_chosen2,
-            color = 'Province_State',
-            log_y = True,
-            title = '(Log) {} Counts'.format(col_chosen2)
-        )
-        
-        fig2.update_layout(
-            title = {'x': 0.5},
-            xaxis = {'title': 'Date'},
-            yaxis = {'title': 'Counts'},
-            legend = {'title': 'State'},
-        )
+    snapshot = store.get()
+    state_series = store.derived('state_series', snapshot)
+    states_chosen = tuple(sorted(set(states_chosen)))
 
-        fig2.update_xaxes(
-            rangeslider_visible=True,
-            rangeselector=dict(
-                buttons=list([
-                    dict(count=3, label="3m", step="month", stepmode="backward"),
-                    dict(count=6, label="6m", step="month", stepmode="backward"),
-                    dict(count=1, label="YTD", step="year", stepmode="todate"),
-                    dict(count=1, label="1y", step="year", stepmode="backward"),
-                    dict(step="all")
-                ])
-            )
+    if (shown is None) or (shown['column'] != col_chosen) or (shown['version'] != snapshot.version):
+        figure = line_plot_cache.get_or_build(
+            snapshot.version,
+            (states_chosen, col_chosen),
+            lambda: line_plot_generator(state_series, states_chosen, col_chosen)
         )
-
-        return fig1, fig2
+        update = {'figure': figure}
 
     else:
-        raise dash.exceptions.PreventUpdate
+        added = [state for state in states_chosen if state not in shown['states']]
+        removed = [state for state in shown['states'] if state not in states_chosen]
+        update = {
+            'add': line_plot_generator(state_series, added, col_chosen).to_plotly_json()['data'],
+            'remove': removed
+        }
 
+    shown = {'states': states_chosen, 'column': col_chosen, 'version': snapshot.version}
 
-# Page Layout Parts
-page_layout1 = dbc.Container(
-    children=[
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        className="text-light text-center bg-dark py-3",
-                        children=[html.H4('Overview of Pandemic Across The US')]
-                    )
-                )
-            ]
-        ),
-
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    incident_rates_heatmap
-                ),
-
-                dbc.Col(
-                    confirmed_cases_heatmap
-                )
-            ]
-        )
-    ]
-)
+    return update, shown
 
-page_layout2 = dbc.Container(
-    className="my-4",
-    children=[
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        className="text-light text-center bg-dark py-3",
-                        children=[html.H4('Aggregated Statistics Since Beginning of Pandemic')]
-                    )
-                )
-            ]
-        ),
-
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    aggregated_stats
-                )
-            ]
-        )
-    ]
-)
 
-page_layout3 = dbc.Container(
-    className="my-4",
-    children=[
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        className="text-light text-center bg-dark py-2",
-                        children=[
-                            html.H4('State Comparisons'),
-                            html.H6('Log(Y-Axis) to account for different population sizes')
-                        ]
-                    )
-                )
-            ]
-        ),
-
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(states_dropdown),
-            ]
-        ),
-
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(column_dropdown1),
-                dbc.Col(column_dropdown2)
-            ]
-        ),
-
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(fig_1),
-                dbc.Col(fig_2)
-            ]
+# Callbacks for fig-1, fig-2
+for n in (1, 2):
+    app.callback(
+        [
+            Output(component_id='fig-{}-update'.format(n), component_property='data'),
+            Output(component_id='fig-{}-shown'.format(n), component_property='data')
+        ],
+        [
+            Input(component_id='states-dropdown', component_property='value'),
+            Input(component_id='col-dropdown{}'.format(n), component_property='value')
+        ],
+        [
+            State(component_id='fig-{}-shown'.format(n), component_property='data')
+        ]
+    )(update_state_comparison)
+
+    # Apply the update in the browser so only the changed traces travel over the network
+    app.clientside_callback(
+        '''
+        function(update, figure) {
+            if (!update) {
+                return window.dash_clientside.no_update;
+            }
+            if (update.figure) {
+                return update.figure;
+            }
+            var data = ((figure && figure.data) || []).filter(function(trace) {
+                return update.remove.indexOf(trace.name) === -1;
+            });
+            return Object.assign({}, figure, {data: data.concat(update.add)});
+        }
+        ''',
+        Output(component_id='fig-{}'.format(n), component_property='figure'),
+        Input(component_id='fig-{}-update'.format(n), component_property='data'),
+        State(component_id='fig-{}'.format(n), component_property='figure')
+    )
+
+
+# Callbacks for lazy heatmaps
+def heatmap_frame(snapshot, name, date_idx):
+    '''
+    Return one date of a heatmap, from the frame cache when possible
+
+    Parameters:
+    -----------
+    snapshot: DataSnapshot
+    name: str name of the heatmap in HEATMAPS
+    date_idx: int position of the date in the snapshot's dates
+
+    Returns:
+    figure: dict of the figure json
+    '''
+
+    heatmap_dates = store.derived('heatmap_dates', snapshot)
+    dates = heatmap_dates['dates']
+    date = dates[min(max(date_idx, 0), len(dates) - 1)]
+    _, column, title = next(heatmap for heatmap in HEATMAPS if heatmap[0] == name)
+
+    figure = heatmap_frame_cache.get_or_build(
+        snapshot.version,
+        (name, date),
+        lambda: heatmap_frame_generator(
+            snapshot.frame.iloc[heatmap_dates['rows'][date]],
+            df_column = column,
+            plot_title = '{} ({})'.format(title, date),
+            range_color = heatmap_dates['ranges'][column]
         )
-    ]
-)
+    )
+
+    return figure
+
+
+def lazy_heatmap(snapshot, name):
+    '''
+    Build a heatmap that starts on the latest date with a slider to load other dates
+
+    Parameters:
+    -----------
+    snapshot: DataSnapshot
+    name: str name of the heatmap in HEATMAPS
+
+    Returns:
+    heatmap: html.Div
+    '''
+
+    dates = store.derived('heatmap_dates', snapshot)['dates']
+    step = max(len(dates) // 6, 1)
+
+    heatmap = html.Div(
+        children=[
+            dcc.Graph(
+                id = 'heatmap-{}'.format(name),
+                figure = heatmap_frame(snapshot, name, len(dates) - 1)
+            ),
+            dcc.Slider(
+                id = 'heatmap-{}-slider'.format(name),
+                min = 0,
+                max = len(dates) - 1,
+                step = 1,
+                value = len(dates) - 1,
+                marks = {idx: dates[idx][:7] for idx in range(0, len(dates), step)},
+                updatemode = 'mouseup'
+            )
+        ]
+    )
+
+    return heatmap
+
+
+for name, _, _ in HEATMAPS:
+    app.callback(
+        Output(component_id='heatmap-{}'.format(name), component_property='figure'),
+        Input(component_id='heatmap-{}-slider'.format(name), component_property='value'),
+        prevent_initial_call=True
+    )(lambda date_idx, name=name: heatmap_frame(store.get(), name, date_idx))
+
+
+# Callbacks for pre-rendered heatmaps
+def prerendered_heatmap(heatmap_assets, name):
+    '''
+    Build a heatmap the browser fills with the figure json from its own cacheable url
+
+    Parameters:
+    -----------
+    heatmap_assets: dict of heatmap name to FigureAsset
+    name: str name of the heatmap in HEATMAPS
+
+    Returns:
+    heatmap: html.Div
+    '''
+
+    heatmap = html.Div(
+        children=[
+            dcc.Graph(
+                id = 'prerendered-heatmap-{}'.format(name),
+                figure = {}
+            ),
+            dcc.Store(
+                id = 'prerendered-heatmap-{}-url'.format(name),
+                data = '/figures/{}.json?v={}'.format(name, heatmap_assets[name].etag)
+            ),
+            dcc.Interval(
+                id = 'prerendered-heatmap-{}-poll'.format(name),
+                interval = 200,
+                max_intervals = 300
+            )
+        ]
+    )
+
+    return heatmap
+
+
+# Clientside callbacks can't return a Promise in this version of Dash, so the figure is fetched
+# in the background and the interval polls until it has arrived, then stops
+for name, _, _ in HEATMAPS:
+    app.clientside_callback(
+        '''
+        function(n_intervals, url) {
+            var figures = window.heatmapFigures = window.heatmapFigures || {};
+            if (!(url in figures)) {
+                figures[url] = null;
+                fetch(url).then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                }).then(function(figure) {
+                    figures[url] = figure;
+                }).catch(function() {
+                    delete figures[url];
+                });
+            }
+            if (!figures[url]) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            return [figures[url], true];
+        }
+        ''',
+        Output(component_id='prerendered-heatmap-{}'.format(name), component_property='figure'),
+        Output(component_id='prerendered-heatmap-{}-poll'.format(name), component_property='disabled'),
+        Input(component_id='prerendered-heatmap-{}-poll'.format(name), component_property='n_intervals'),
+        State(component_id='prerendered-heatmap-{}-url'.format(name), component_property='data')
+    )
 
 
 # Page Layout
-layout = html.Div(
-    children=[
-        page_layout1,
-        page_layout2,
-        page_layout3
-    ]
-)
+def build_page_layout(snapshot):
+    '''
+    Build the dashboard page for one version of the data
+
+    Parameters:
+    -----------
+    snapshot: DataSnapshot
+
+    Returns:
+    layout: html.Div
+    '''
+
+    df = snapshot.frame
+
+    # Dropdowns
+    # State Comparisons Dropdowns: States, Col1, Col2
+    unique_states, unique_cols = unique_states_and_cols(df)
+
+    states_dropdown = dcc.Dropdown(
+        id = 'states-dropdown',
+        options = [{'label': state, 'value': state} for state in unique_states],
+        value = ['California', 'New York'],
+        multi = True
+    )
+
+    column_dropdown1 = dcc.Dropdown(
+        id = 'col-dropdown1',
+        options = [{'label': col, 'value': col} for col in unique_cols],
+        value = 'Confirmed',
+    )
+
+    column_dropdown2 = dcc.Dropdown(
+        id = 'col-dropdown2',
+        options = [{'label': col, 'value': col} for col in unique_cols],
+        value = 'Deaths',
+    )
+
+
+    # Plots
+    # Overview Heatmaps
+    if HEATMAP_MODE == 'lazy':
+        incident_rates_heatmap, confirmed_cases_heatmap = [
+            lazy_heatmap(snapshot, name) for name, _, _ in HEATMAPS
+        ]
+
+    # Loaded by the browser from their own cacheable urls
+    else:
+        heatmap_assets = store.derived('heatmap_assets', snapshot)
+        incident_rates_heatmap, confirmed_cases_heatmap = [
+            prerendered_heatmap(heatmap_assets, name) for name, _, _ in HEATMAPS
+        ]
+
+    # Aggregated Stats Scatter Plots
+    national_df = national_reader()
+    if national_df.empty:
+        national_df = national_aggregate(df)
+    aggregated_stats = aggregated_stats_generator(national_df, unique_cols)
+
+
+    # Page Layout Parts
+    page_layout1 = dbc.Container(
+        children=[
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            className="text-light text-center bg-dark py-3",
+                            children=[html.H4('Overview of Pandemic Across The US')]
+                        )
+                    )
+                ]
+            ),
+
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        incident_rates_heatmap
+                    ),
+
+                    dbc.Col(
+                        confirmed_cases_heatmap
+                    )
+                ]
+            )
+        ]
+    )
+
+    page_layout2 = dbc.Container(
+        className="my-4",
+        children=[
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            className="text-light text-center bg-dark py-3",
+                            children=[html.H4('Aggregated Statistics Since Beginning of Pandemic')]
+                        )
+                    )
+                ]
+            ),
+
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        aggregated_stats
+                    )
+                ]
+            )
+        ]
+    )
+
+    page_layout3 = dbc.Container(
+        className="my-4",
+        children=[
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            className="text-light text-center bg-dark py-2",
+                            children=[
+                                html.H4('State Comparisons'),
+                                html.H6('Log(Y-Axis) to account for different population sizes')
+                            ]
+                        )
+                    )
+                ]
+            ),
+
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(states_dropdown),
+                ]
+            ),
+
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(column_dropdown1),
+                    dbc.Col(column_dropdown2)
+                ]
+            ),
+
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(fig_1),
+                    dbc.Col(fig_2)
+                ]
+            ),
+
+            html.Div(fig_stores)
+        ]
+    )
+
+    layout = html.Div(
+        children=[
+            page_layout1,
+            page_layout2,
+            page_layout3
+        ]
+    )
+
+    return layout
+
+
+def build_heatmap_assets(snapshot):
+    df = snapshot.frame
+    heatmap_assets = {
+        name: render_figure_asset(heatmap_figure_generator(df, df_column = column, plot_title = title))
+        for name, column, title in HEATMAPS
+    }
+
+    return heatmap_assets
+
+
+def build_heatmap_dates(snapshot):
+    df = snapshot.frame
+    date_rows = df.groupby(df['Date'].dt.strftime('%Y-%m-%d'), sort = True).indices
+    heatmap_dates = {
+        'dates': sorted(date_rows),
+        'rows': date_rows,
+        'ranges': {column: (float(df[column].min()), float(df[column].max())) for _, column, _ in HEATMAPS}
+    }
+
+    return heatmap_dates
+
+
+def build_state_series(snapshot):
+    _, unique_cols = unique_states_and_cols(snapshot.frame)
+    return state_series_generator(snapshot.frame, unique_cols)
+
+
+# Built on the first request for each data version, and ahead of the swap once the page is in use
+if HEATMAP_MODE == 'lazy':
+    store.register('heatmap_dates', build_heatmap_dates)
+else:
+    store.register('heatmap_assets', build_heatmap_assets)
+store.register('dashboard_layout', build_page_layout)
+store.register('state_series', build_state_series)
+
+
+def layout():
+    return store.derived('dashboard_layout')
+
+
+# Pre-rendered heatmaps
+# Lazy mode has no figure files, answer 404 rather than letting Dash's catch-all route serve the app for these urls
+@app.server.route('/figures/<name>.json')
+def heatmap_asset(name):
+    if HEATMAP_MODE == 'lazy':
+        return 'Figure not found', 404
+
+    heatmap_assets = store.derived('heatmap_assets')
+    if name not in heatmap_assets:
+        return 'Figure not found', 404
+
+    return serve_figure_asset(heatmap_assets[name])
 
 
 if __name__ == '__main__':
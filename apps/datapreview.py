@@ -1,19 +1,17 @@
-import pandas as pd
+from datetime import date
+import dash
 import dash_bootstrap_components as dbc
 from dash import html, Input, Output, State, dash_table
-from app import app, db
+from app import app
+from dashboard_functions import table_columns, table_page_reader, table_row_count
 
 
-# Read in data
-sql_query = '''
-SELECT
-    *
-FROM
-    covid_data
-LIMIT 100
-'''
-df = pd.read_sql(sql = sql_query, con = db.engine)
-df = df.drop(['Id'], axis=1)
+# DataTable column types by the python type of the database column
+table_column_types = {
+    int: 'numeric',
+    float: 'numeric',
+    date: 'datetime'
+}
 
 
 # Create Data Table
@@ -58,9 +56,22 @@ data_table = dash_table.DataTable(
         }
     ],
 
-    columns = [{'name': i, 'id': i} for i in df.columns],
+    id = 'data-table',
+    columns = [
+        {'name': column.name, 'id': column.name, 'type': table_column_types.get(column.type.python_type, 'text')}
+        for column in table_columns()
+    ],
+
+    # Pages are read from the database, filtered and sorted there, one at a time
+    page_action = 'custom',
+    filter_action = 'custom',
+    sort_action = 'custom',
+    sort_mode = 'multi',
+    page_current = 0,
     page_size = 10,
-    data = df.to_dict('records')
+    page_count = 1,
+    filter_query = '',
+    sort_by = []
 )
 
 
@@ -150,6 +161,27 @@ def toggle_offcanvas(n1, is_open):
     return is_open
 
 
+# Callback For Data Table Pages
+@app.callback(
+    Output('data-table', 'data'),
+    Output('data-table', 'page_count'),
+    Input('data-table', 'page_current'),
+    Input('data-table', 'page_size'),
+    Input('data-table', 'sort_by'),
+    Input('data-table', 'filter_query')
+)
+def update_table(page_current, page_size, sort_by, filter_query):
+    records = table_page_reader(page_current or 0, page_size, sort_by, filter_query)
+
+    # Paging and sorting don't change the row count, so only count again when the filter changes
+    triggered = dash.callback_context.triggered
+    if triggered and all(trigger['prop_id'] in ('data-table.page_current', 'data-table.sort_by') for trigger in triggered):
+        return records, dash.no_update
+
+    page_count = max(1, -(-table_row_count(filter_query) // page_size))
+    return records, page_count
+
+
 # Page Layout Parts
 page_content_1 = dbc.Container(
     children=[
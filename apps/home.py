@@ -1,18 +1,13 @@
+from urllib.parse import urlencode
 from dash import html, dcc, Output, Input
 import dash_bootstrap_components as dbc
-import pandas as pd
-from app import app, db
+from app import app
+from data_clean.data_cleaning import us_state_abbrev, excluded_states
+from data_export import export_formats, available_formats, serve_export
 
 
-# Read in data
-sql_query = '''
-SELECT
-    *
-FROM
-    covid_data
-'''
-df = pd.read_sql(sql = sql_query, con = db.engine)
-df = df.drop(['Id'], axis=1)
+# States that can be picked for a filtered download
+download_states = sorted(state for state in us_state_abbrev if state not in excluded_states)
 
 
 # Create Download/Source/Contact Cards
@@ -23,16 +18,54 @@ download_card = dbc.Card(
             dbc.Col(html.H2('Copy of Data'))
         ),
 
+        dbc.Row(
+            className="g-1 px-3 pb-1",
+            children=[
+                dbc.Col(
+                    dbc.Select(
+                        id='download-format',
+                        options=[{'label': export_formats[fmt]['label'], 'value': fmt} for fmt in available_formats()],
+                        value='csv'
+                    )
+                ),
+
+                dbc.Col(
+                    dcc.DatePickerRange(
+                        id='download-dates',
+                        display_format='YYYY-MM-DD',
+                        start_date_placeholder_text='First Date',
+                        end_date_placeholder_text='Last Date',
+                        clearable=True
+                    )
+                )
+            ]
+        ),
+
+        dbc.Row(
+            className="px-3 pb-2",
+            children=[
+                dbc.Col(
+                    dcc.Dropdown(
+                        id='download-states',
+                        options=[{'label': state, 'value': state} for state in download_states],
+                        multi=True,
+                        placeholder='All States',
+                        className='text-start'
+                    )
+                )
+            ]
+        ),
+
         dbc.Row(
             dbc.Col(
                 children=[
                     dbc.Button(
                         children=['Download'],
                         id='btn-download-data',
+                        href='/download/csv',
+                        external_link=True,
                         color='dark'
-                    ),
-
-                    dcc.Download(id="download-data")
+                    )
                 ]
             )
         )
@@ -168,14 +201,32 @@ page_content_2 = dbc.Container(
 )
 
 
-# Callback To Download Data
+# Callback To Point The Download Button At The Chosen Export
 @app.callback(
-    Output("download-data", "data"),
-    Input("btn-download-data", "n_clicks"),
-    prevent_initial_call=True,
+    Output('btn-download-data', 'href'),
+    Input('download-format', 'value'),
+    Input('download-states', 'value'),
+    Input('download-dates', 'start_date'),
+    Input('download-dates', 'end_date')
 )
-def func(n_clicks):
-    return dcc.send_data_frame(df.to_csv, filename="data.csv")
+def update_download_link(fmt, states, start_date, end_date):
+    query = [('state', state) for state in sorted(states or [])]
+    if start_date:
+        query.append(('start', start_date[:10]))
+    if end_date:
+        query.append(('end', end_date[:10]))
+
+    href = '/download/{}'.format(fmt or 'csv')
+    if query:
+        href += '?' + urlencode(query)
+
+    return href
+
+
+# Route To Download Data
+@app.server.route('/download/<fmt>')
+def download_data(fmt):
+    return serve_export(fmt)
 
 
 # Page Layout
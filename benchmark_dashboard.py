@@ -0,0 +1,277 @@
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+
+def post_callback(client, output, inputs, outputs):
+    '''
+    Call a Dash callback through the test client the way the browser does
+
+    Parameters:
+    -----------
+    client: flask test client
+    output: string output id and property, e.g. 'page-content.children'
+    inputs: list of input dicts with id, property and value
+    outputs: dict of the output id and property
+
+    Returns:
+    response: flask test response
+    '''
+
+    body = {
+        'output': output,
+        'outputs': outputs,
+        'inputs': inputs,
+        'state': [],
+        'changedPropIds': ['{}.{}'.format(inputs[0]['id'], inputs[0]['property'])]
+    }
+
+    return client.post('/_dash-update-component', json = body)
+
+
+def dashboard_payload(client, repeat):
+    '''
+    Time the /dashboard page layout and measure every byte the browser needs before the heatmaps can paint
+
+    Parameters:
+    -----------
+    client: flask test client
+    repeat: int number of warm layout requests timed
+
+    Returns:
+    payload: dict of sizes in bytes and times in milliseconds
+    '''
+
+    def layout_request():
+        return post_callback(
+            client,
+            'page-content.children',
+            [{'id': 'url', 'property': 'pathname', 'value': '/dashboard'}],
+            {'id': 'page-content', 'property': 'children'}
+        )
+
+    start = time.perf_counter()
+    response = layout_request()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layout_request()
+        durations.append(time.perf_counter() - start)
+
+    payload = {
+        'layout_cold_ms': cold_ms,
+        'layout_warm_ms': statistics.median(durations) * 1000,
+        'layout_bytes': len(response.data),
+        'layout_gzip_bytes': len(gzip.compress(response.data)),
+        'asset_bytes': 0
+    }
+
+    # Pre-rendered heatmap figures the layout fetches by url
+    for url in sorted(set(re.findall(r'/figures/[^"]+', response.data.decode()))):
+        payload['asset_bytes'] += len(client.get(url, headers = {'Accept-Encoding': 'br, gzip'}).data)
+
+    return payload
+
+
+def embedded_payload():
+    '''
+    Size of the layout as it was when both animated heatmaps were embedded in it
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    payload: dict of sizes in bytes
+    '''
+
+    from apps.dashboard import HEATMAPS
+    from dashboard_functions import heatmap_figure_generator
+    from data_store import store
+
+    df = store.get().frame
+    figures = ''.join(
+        heatmap_figure_generator(df, df_column = column, plot_title = title).to_json()
+        for _, column, title in HEATMAPS
+    ).encode()
+
+    payload = {
+        'heatmap_json_bytes': len(figures),
+        'heatmap_json_gzip_bytes': len(gzip.compress(figures))
+    }
+
+    return payload
+
+
+def run_mode(repeat):
+    '''
+    Measure the dashboard payload in the HEATMAP_MODE this process was started with and print it as json
+
+    Parameters:
+    -----------
+    repeat: int number of warm layout requests timed
+
+    Returns:
+    None
+    '''
+
+    import index
+
+    client = index.server.test_client()
+    payload = dashboard_payload(client, repeat)
+    if os.environ.get('HEATMAP_MODE', 'prerendered') == 'prerendered':
+        payload.update(embedded_payload())
+
+    print(json.dumps(payload))
+
+    return None
+
+
+def run_benchmark(modes, repeat, mbps):
+    '''
+    Measure the dashboard payload in every heatmap mode, each in its own process since the mode is read at import
+
+    Parameters:
+    -----------
+    modes: list of HEATMAP_MODE values
+    repeat: int number of warm layout requests timed
+    mbps: float link speed used to estimate transfer times
+
+    Returns:
+    None
+    '''
+
+    def transfer_ms(size):
+        return size * 8 / (mbps * 1000)
+
+    print('{:<28}{:>14}{:>14}{:>14}{:>16}'.format('Mode', 'Server ms', 'Gzip bytes', 'Assets bytes', 'Est. paint ms'))
+
+    for mode in modes:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--single', '--repeat', str(repeat)],
+            env = {**os.environ, 'HEATMAP_MODE': mode},
+            check = True,
+            stdout = subprocess.PIPE
+        ).stdout.decode()
+        payload = json.loads(output.strip().splitlines()[-1])
+
+        # The browser paints the heatmaps once the layout and the figure json have arrived
+        critical_bytes = payload['layout_gzip_bytes'] + payload['asset_bytes']
+        paint_ms = payload['layout_warm_ms'] + transfer_ms(critical_bytes)
+        print('{:<28}{:>14.1f}{:>14}{:>14}{:>16.0f}'.format(mode, payload['layout_warm_ms'], payload['layout_gzip_bytes'], payload['asset_bytes'], paint_ms))
+
+        if 'heatmap_json_gzip_bytes' in payload:
+            embedded_bytes = payload['layout_gzip_bytes'] + payload['heatmap_json_gzip_bytes']
+            print('{:<28}{:>14}{:>14}{:>14}{:>16.0f}'.format('embedded (before)', '', embedded_bytes, 0, payload['layout_warm_ms'] + transfer_ms(embedded_bytes)))
+
+    print('Est. paint ms is server time plus transfer at {} Mbit/s, browser parse and render time is not included'.format(mbps))
+
+    return None
+
+
+def legacy_line_plot(df, states_chosen, col_chosen):
+    '''
+    The state comparison plot as the callback built it before the per-state series index:
+    an isin scan over the whole frame, then px.line
+
+    Parameters:
+    -----------
+    df: dataframe of every record
+    states_chosen: list of state names
+    col_chosen: str
+
+    Returns:
+    fig: plotly figure
+    '''
+
+    import plotly.express as px
+
+    tmp_df = df[df['Province_State'].isin(states_chosen)]
+
+    fig = px.line(
+        data_frame = tmp_df,
+        x = 'Date',
+        y = col_chosen,
+        color = 'Province_State',
+        log_y = True,
+        title = '(Log) {} Counts'.format(col_chosen)
+    )
+
+    fig.update_layout(
+        title = {'x': 0.5},
+        xaxis = {'title': 'Date'},
+        yaxis = {'title': 'Counts'},
+        legend = {'title': 'State'},
+    )
+
+    return fig
+
+
+def run_callback_benchmark(state_counts, repeat):
+    '''
+    Time building both state comparison figures against the number of states chosen,
+    with the legacy isin scan and with the per-state series index, figure cache bypassed
+
+    Parameters:
+    -----------
+    state_counts: list of int numbers of states chosen
+    repeat: int calls timed per state count
+
+    Returns:
+    None
+    '''
+
+    from dashboard_functions import unique_states_and_cols, state_series_generator, line_plot_generator
+    from data_store import store
+
+    df = store.get().frame
+    unique_states, unique_cols = unique_states_and_cols(df)
+    state_series = state_series_generator(df, unique_cols)
+
+    def time_call(build):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            build()
+            durations.append(time.perf_counter() - start)
+        return statistics.median(durations) * 1000
+
+    print('{:<10}{:>14}{:>14}{:>10}'.format('States', 'Legacy ms', 'Index ms', 'Speedup'))
+
+    for state_count in state_counts:
+        states_chosen = list(unique_states[:state_count])
+
+        # The callback builds both figures and serializes them for the response
+        legacy_ms = time_call(lambda: [legacy_line_plot(df, states_chosen, col).to_json() for col in ('Confirmed', 'Deaths')])
+        index_ms = time_call(lambda: [line_plot_generator(state_series, states_chosen, col).to_json() for col in ('Confirmed', 'Deaths')])
+
+        print('{:<10}{:>14.1f}{:>14.1f}{:>9.1f}x'.format(len(states_chosen), legacy_ms, index_ms, legacy_ms / index_ms))
+
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Measure the /dashboard payload in each heatmap mode and the state comparison callback latency, using the database at DATABASE_URL')
+    parser.add_argument('--benchmarks', nargs = '+', choices = ['payload', 'callback'], default = ['payload', 'callback'])
+    parser.add_argument('--modes', nargs = '+', default = ['prerendered', 'lazy'])
+    parser.add_argument('--repeat', type = int, default = 10, help = 'warm layout requests timed per mode')
+    parser.add_argument('--mbps', type = float, default = 10, help = 'link speed used to estimate transfer times')
+    parser.add_argument('--states', type = int, nargs = '+', default = [1, 5, 10, 25, 50], help = 'numbers of states chosen in the callback benchmark')
+    parser.add_argument('--single', action = 'store_true', help = 'measure only the HEATMAP_MODE of this process and print json')
+    args = parser.parse_args()
+
+    if args.single:
+        run_mode(args.repeat)
+    else:
+        if 'payload' in args.benchmarks:
+            run_benchmark(args.modes, args.repeat, args.mbps)
+        if 'callback' in args.benchmarks:
+            run_callback_benchmark(args.states, args.repeat)
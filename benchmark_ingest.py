@@ -0,0 +1,200 @@
+import os
+import time
+import argparse
+import tempfile
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, MetaData
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from data_clean.data_cleaning import us_state_abbrev, report_dtypes
+from app import CovidData
+from database import database_url
+from ingest import build_batch, bulk_insert
+
+
+def synthetic_reports(report_count, seed = 0):
+    '''
+    Build cleaned reports the way parse_report returns them, one row per state per day
+
+    Parameters:
+    -----------
+    report_count: int number of daily reports
+    seed: int seed of the random counts
+
+    Returns:
+    reports: list of (date, tmp_df) tuples, the date as in a report's file name
+    '''
+
+    rng = np.random.default_rng(seed)
+    states = list(us_state_abbrev)
+
+    reports = []
+    for day in range(report_count):
+        report_day = date(2020, 4, 12) + timedelta(days = day)
+        tmp_df = pd.DataFrame({
+            col: states if col == 'Province_State' else rng.random(len(states)) * 100000
+            for col in report_dtypes
+        })
+        tmp_df['Date'] = pd.Timestamp(report_day)
+        reports.append((report_day.strftime('%m-%d-%Y'), tmp_df))
+
+    return reports
+
+
+def legacy_batch(reports):
+    '''
+    Accumulate reports the way fill_database did before build_batch:
+    concat and drop_duplicates(keep = False) on every report, then renumber the whole frame
+
+    Parameters:
+    -----------
+    reports: list of (date, tmp_df) tuples
+
+    Returns:
+    df: Pandas dataframe
+    '''
+
+    df = pd.DataFrame()
+    for _, tmp_df in reports:
+        tmp_df = tmp_df.reset_index()
+        tmp_df = tmp_df.rename(columns = {'index': 'Id'})
+
+        df = pd.concat([df, tmp_df], ignore_index = True).drop_duplicates(keep = False)
+        df = df.drop(columns = ['Id'], axis = 1)
+        df.reset_index(inplace = True)
+        df = df.rename(columns = {'index': 'Id'})
+
+    return df
+
+
+def batch_benchmark(report_counts):
+    '''
+    Time building a batch of reports with the legacy loop and with build_batch
+
+    Parameters:
+    -----------
+    report_counts: list of int numbers of synthetic reports
+
+    Returns:
+    None
+    '''
+
+    print('{:<10}{:>14}{:>16}{:>10}'.format('Reports', 'Legacy s', 'build_batch s', 'Speedup'))
+
+    for report_count in report_counts:
+        reports = synthetic_reports(report_count)
+
+        start = time.perf_counter()
+        legacy_batch(reports)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_batch(reports)
+        batch_seconds = time.perf_counter() - start
+
+        print('{:<10}{:>14.2f}{:>16.2f}{:>9.1f}x'.format(report_count, legacy_seconds, batch_seconds, legacy_seconds / batch_seconds))
+
+    return None
+
+
+def benchmark_table(metadata):
+    '''
+    A copy of covid_data, indexes included, under its own name so a real database's data is never touched
+
+    Parameters:
+    -----------
+    metadata: SQLAlchemy MetaData
+
+    Returns:
+    table: SQLAlchemy table
+    '''
+
+    table = CovidData.__table__.to_metadata(metadata, name = 'benchmark_covid_data')
+    for index in table.indexes:
+        index.name = index.name.replace('covid_data', 'benchmark_covid_data')
+
+    return table
+
+
+def insert_benchmark(url, df, repeat):
+    '''
+    Time writing a batch with to_sql and with bulk_insert, each in one transaction
+
+    Parameters:
+    -----------
+    url: string url of a database the benchmark may create a table in
+    df: Pandas dataframe from build_batch
+    repeat: int runs per write path, the fastest is reported
+
+    Returns:
+    None
+    '''
+
+    url = make_url(database_url(url))
+    try:
+        engine = create_engine(url)
+        engine.connect().close()
+    except (ImportError, SQLAlchemyError) as error:
+        print('{:<12}skipped, {} is not reachable: {}'.format(url.get_backend_name(), repr(url), str(error).splitlines()[0]))
+        return None
+
+    table = benchmark_table(MetaData())
+    table.drop(engine, checkfirst = True)
+    table.create(engine)
+
+    def to_sql(connection):
+        df.to_sql(table.name, con = connection, if_exists = 'append', index = False)
+
+    def copy(connection):
+        bulk_insert(connection, df, table)
+
+    try:
+        for name, write in (('to_sql', to_sql), ('bulk_insert', copy)):
+            durations = []
+            for _ in range(repeat):
+                with engine.begin() as connection:
+                    connection.execute(table.delete())
+
+                start = time.perf_counter()
+                with engine.begin() as connection:
+                    write(connection)
+                durations.append(time.perf_counter() - start)
+
+            seconds = min(durations)
+            print('{:<12}{:<14}{:>10}{:>12.2f}{:>14.0f}'.format(engine.dialect.name, name, len(df), seconds, len(df) / seconds))
+    finally:
+        table.drop(engine)
+        engine.dispose()
+
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Time the ingest write path on synthetic reports')
+    parser.add_argument('--benchmarks', nargs = '+', choices = ['batch', 'insert'], default = ['batch', 'insert'])
+    parser.add_argument('--reports', type = int, nargs = '+', default = [50, 200, 800], help = 'numbers of synthetic reports batched')
+    parser.add_argument('--insert-reports', type = int, default = 800, help = 'synthetic reports in the batch written by the insert benchmark')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per write path')
+    parser.add_argument(
+        '--postgres-url',
+        default = os.environ.get('BENCHMARK_POSTGRES_URL'),
+        help = 'PostgreSQL database the insert benchmark may create a table in, skipped if unset or unreachable'
+    )
+    args = parser.parse_args()
+
+    if 'batch' in args.benchmarks:
+        batch_benchmark(args.reports)
+
+    if 'insert' in args.benchmarks:
+        df = build_batch(synthetic_reports(args.insert_reports))
+        urls = ['sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')]
+        if args.postgres_url:
+            urls.append(args.postgres_url)
+        else:
+            print('PostgreSQL skipped, pass --postgres-url or set BENCHMARK_POSTGRES_URL to include it')
+
+        print('{:<12}{:<14}{:>10}{:>12}{:>14}'.format('Database', 'Write path', 'Rows', 'Seconds', 'Rows/s'))
+        for url in urls:
+            insert_benchmark(url, df, args.repeat)
@@ -0,0 +1,193 @@
+import os
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import date, timedelta
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Float, String, select, delete, func
+from data_clean.data_cleaning import us_state_abbrev
+from app import CovidData
+from migrate import migrate_database
+
+
+def legacy_table(metadata):
+    '''
+    The covid_data table as it was created before the migration:
+    dates stored as 'MM-DD-YYYY' text, counts as floats and no index besides the primary key
+
+    Parameters:
+    -----------
+    metadata: SQLAlchemy MetaData
+
+    Returns:
+    table: SQLAlchemy table
+    '''
+
+    return Table(
+        'covid_data', metadata,
+        Column('Id', Integer, primary_key = True),
+        Column('Province_State', String(25)),
+        Column('Confirmed', Integer),
+        Column('Deaths', Integer),
+        Column('Active', Float),
+        Column('Incident_Rate', Float),
+        Column('Total_Test_Results', Float),
+        Column('Case_Fatality_Ratio', Float),
+        Column('Testing_Rate', Float),
+        Column('Date', String(10))
+    )
+
+
+def seed_database(engine, table, days):
+    '''
+    Fill the legacy covid_data table with one synthetic row per state per day
+
+    Parameters:
+    -----------
+    engine: database engine
+    table: SQLAlchemy table from legacy_table
+    days: int number of daily reports
+
+    Returns:
+    dates: list of the seeded datetime.date values
+    '''
+
+    states = list(us_state_abbrev)
+    dates = [date(2020, 4, 12) + timedelta(days = day) for day in range(days)]
+
+    with engine.begin() as connection:
+        for day, report_date in enumerate(dates):
+            connection.execute(
+                table.insert(),
+                [
+                    {
+                        'Id': day * len(states) + i,
+                        'Province_State': state,
+                        'Confirmed': (day + 1) * (i + 10) * 17,
+                        'Deaths': (day + 1) * (i + 10) // 3,
+                        'Active': float((day + 1) * (i + 10) * 5),
+                        'Incident_Rate': (day + 1) * 0.37 + i,
+                        'Total_Test_Results': float((day + 1) * (i + 10) * 211),
+                        'Case_Fatality_Ratio': 1.5 + i / 100,
+                        'Testing_Rate': (day + 1) * 2.9 + i,
+                        'Date': report_date.strftime('%m-%d-%Y')
+                    }
+                    for i, state in enumerate(states)
+                ]
+            )
+
+    return dates
+
+
+def access_paths(table, report_date, row_count):
+    '''
+    Queries made by the dashboard, data preview and ingest
+
+    Parameters:
+    -----------
+    table: SQLAlchemy covid_data table
+    report_date: value of a date in the middle of the data, as stored in the table
+    row_count: int number of rows in the table
+
+    Returns:
+    queries: list of (name, query) tuples
+    '''
+
+    queries = [
+        ('dashboard: all rows by date', select(table).order_by(table.c.Date)),
+        ('dashboard: latest date', select(table).where(table.c.Date == select(func.max(table.c.Date)).scalar_subquery())),
+        ('dashboard: one state series', select(table).where(table.c.Province_State == 'Texas').order_by(table.c.Date)),
+        ('datapreview: first page', select(table).order_by(table.c.Date, table.c.Province_State).limit(10)),
+        ('datapreview: middle page', select(table).order_by(table.c.Date, table.c.Province_State).limit(10).offset(row_count // 2)),
+        ('datapreview: state filter count', select(func.count()).select_from(table).where(table.c.Province_State == 'Texas')),
+        ('datapreview: one date', select(table).where(table.c.Date == report_date)),
+        ('ingest: replace one date', delete(table).where(table.c.Date == report_date)),
+    ]
+
+    return queries
+
+
+def time_queries(engine, queries, repeat):
+    '''
+    Run each query repeat times and keep the median time
+    Every run is rolled back so deletes don't change the data
+
+    Parameters:
+    -----------
+    engine: database engine
+    queries: list of (name, query) tuples
+    repeat: int number of runs per query
+
+    Returns:
+    timings: dict of query name to median milliseconds
+    '''
+
+    timings = {}
+    for name, query in queries:
+        durations = []
+        for _ in range(repeat):
+            with engine.connect() as connection:
+                transaction = connection.begin()
+                start = time.perf_counter()
+                result = connection.execute(query)
+                if result.returns_rows:
+                    result.fetchall()
+                durations.append(time.perf_counter() - start)
+                transaction.rollback()
+
+        timings[name] = statistics.median(durations) * 1000
+
+    return timings
+
+
+def run_benchmark(database_url, days, repeat):
+    '''
+    Seed a database with the legacy schema, time the access paths, migrate it and time them again
+
+    Parameters:
+    -----------
+    database_url: string SQLAlchemy url of an empty database
+    days: int number of daily reports to seed
+    repeat: int number of runs per query
+
+    Returns:
+    None
+    '''
+
+    engine = create_engine(database_url)
+
+    table = legacy_table(MetaData())
+    table.create(engine)
+    dates = seed_database(engine, table, days)
+    row_count = days * len(us_state_abbrev)
+    middle_date = dates[len(dates) // 2]
+
+    print('Seeded {} rows on {}'.format(row_count, engine.dialect.name))
+    before = time_queries(engine, access_paths(table, middle_date.strftime('%m-%d-%Y'), row_count), repeat)
+
+    migrate_database(engine)
+    after = time_queries(engine, access_paths(CovidData.__table__, middle_date, row_count), repeat)
+
+    print('{:<34}{:>12}{:>12}'.format('Query (median ms)', 'Before', 'After'))
+    for name in before:
+        print('{:<34}{:>12.2f}{:>12.2f}'.format(name, before[name], after[name]))
+
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Time the covid_data access paths before and after the schema migration')
+    parser.add_argument(
+        '--database-url',
+        help = 'empty database to seed, defaults to a new SQLite file in the temp directory'
+    )
+    parser.add_argument('--days', type = int, default = 900, help = 'number of daily reports to seed')
+    parser.add_argument('--repeat', type = int, default = 20, help = 'runs per query')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+        database_url = 'sqlite:///' + database_path
+
+    run_benchmark(database_url, args.days, args.repeat)
@@ -0,0 +1,76 @@
+import os
+import time
+import argparse
+import tempfile
+import statistics
+from app import db
+from dashboard_functions import data_reader, prepare_frame
+from data_snapshot import read_version, read_snapshot, publish_snapshot, pa
+
+
+def time_load(load, repeat):
+    '''
+    Time a way of loading the covid frame
+
+    Parameters:
+    -----------
+    load: function returning the frame
+    repeat: int number of loads timed
+
+    Returns:
+    seconds: float median seconds per load
+    rows: int rows loaded
+    '''
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = load()
+        durations.append(time.perf_counter() - start)
+
+    return statistics.median(durations), len(df)
+
+
+def run_benchmark(repeat):
+    '''
+    Time loading the covid frame the way a web worker boots, from SQL and from a published snapshot
+
+    Parameters:
+    -----------
+    repeat: int number of loads timed per path
+
+    Returns:
+    None
+    '''
+
+    if pa is None:
+        print('pyarrow is not installed, snapshots are never published')
+        return None
+
+    # A snapshot of its own, so the one the web process serves is left alone
+    version = read_version()
+    path = os.path.join(tempfile.mkdtemp(), 'covid_data.feather')
+    with db.engine.connect() as connection:
+        publish_snapshot(connection, path)
+
+    # What load_frame does when the snapshot is current
+    def snapshot_reader():
+        return prepare_frame(read_snapshot(version, path))
+
+    print('{:<22}{:>10}{:>12}{:>10}'.format('Load path', 'Rows', 'Seconds', 'Speedup'))
+
+    sql_seconds, rows = time_load(data_reader, repeat)
+    print('{:<22}{:>10}{:>12.3f}{:>9.1f}x'.format('read_sql + data_reader', rows, sql_seconds, 1))
+
+    snapshot_seconds, rows = time_load(snapshot_reader, repeat)
+    print('{:<22}{:>10}{:>12.3f}{:>9.1f}x'.format('feather snapshot', rows, snapshot_seconds, sql_seconds / snapshot_seconds))
+
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Time a web worker loading covid_data from the database at DATABASE_URL and from a snapshot of it')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'loads timed per path')
+    args = parser.parse_args()
+
+    run_benchmark(args.repeat)
@@ -1,8 +1,14 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from dash import dcc
-from data_clean.data_cleaning import us_state_abbrev
-from app import db
+from data_clean.data_cleaning import us_state_abbrev, column_dtypes
+import re
+import operator
+from datetime import date
+from sqlalchemy import select, func, cast, false, String
+from app import db, CovidData, CovidNationalDaily
 
 
 def data_reader():
@@ -19,11 +25,29 @@ def data_reader():
 
     df = pd.read_sql('covid_data', con = db.engine)
     df = df.drop(['Id'], axis=1)
-    df = df[df['Province_State'] != 'Recovered']
+    df = prepare_frame(df)
+
+    return df
+
+
+def prepare_frame(df):
+    '''
+    Sort records by date, add state codes and apply the compact column dtypes
+
+    Parameters:
+    -----------
+    df: Pandas dataframe of covid_data without the Id column
+
+    Returns:
+    df: Pandas dataframe
+    '''
+
+    df = df[df['Province_State'] != 'Recovered'].copy()
+    df['Province_State'] = df['Province_State'].astype(str)
+    df['State_Code'] = df['Province_State'].map(us_state_abbrev)
     df['Date'] = pd.to_datetime(df['Date'])
+    df = df.astype({col: dtype for col, dtype in column_dtypes.items() if col in df.columns})
     df = df.sort_values(by = 'Date', ascending = True)
-    df['Date'] = df['Date'].astype(str)
-    df['State_Code'] = df['Province_State'].map(us_state_abbrev)
 
     return df
 
@@ -50,9 +74,9 @@ def unique_states_and_cols(df):
     return unique_states, unique_cols
 
 
-def heatmap_generator(df, df_column, plot_title):
+def heatmap_figure_generator(df, df_column, plot_title):
     '''
-    Generate heatmap graph
+    Generate animated heatmap figure
 
     Parameters:
     -----------
@@ -61,9 +85,12 @@ def heatmap_generator(df, df_column, plot_title):
     plot_title: str
 
     Returns:
-    heatmap: dcc.Graph
+    fig: plotly figure
     '''
 
+    # Animation frames are labelled with the date string rather than a full timestamp
+    df = df.assign(Date = df['Date'].dt.strftime('%Y-%m-%d'))
+
     fig = px.choropleth(
         data_frame = df,
         locations = 'State_Code',
@@ -86,12 +113,67 @@ def heatmap_generator(df, df_column, plot_title):
         margin = {'b': 0, 'l': 0, 'r': 0},
     )
     fig['layout']['updatemenus'][0]['pad']['l'] = 50
-    
-    heatmap = dcc.Graph(
-        figure = fig,
+
+    return fig
+
+
+def heatmap_frame_generator(df, df_column, plot_title, range_color):
+    '''
+    Generate a single date heatmap figure
+    The color range is fixed by the caller so every date is drawn on the same scale
+
+    Parameters:
+    -----------
+    df: dataframe of one date's records
+    df_column: pandas series
+    plot_title: str
+    range_color: (min, max) tuple of the color scale
+
+    Returns:
+    fig: plotly figure
+    '''
+
+    fig = px.choropleth(
+        data_frame = df,
+        locations = 'State_Code',
+        locationmode = 'USA-states',
+        color = df_column,
+        scope = 'usa',
+        color_continuous_scale = 'blues',
+        range_color = range_color,
+        hover_name = 'Province_State',
+        hover_data = {
+            'Incident_Rate': True,
+            'State_Code': False
+        },
+        title=plot_title
+    )
+
+    fig.update_layout(
+        title = {'x': 0.5, 'y': 0.85},
+        margin = {'b': 0, 'l': 0, 'r': 0},
     )
 
-    return heatmap
+    return fig
+
+
+def national_reader():
+    '''
+    Read the national daily aggregate maintained by ingest into memory
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    df: Pandas dataframe sorted by date, empty if the table hasn't been built
+    '''
+
+    df = pd.read_sql(select(CovidNationalDaily.__table__), con = db.engine)
+    df['Date'] = pd.to_datetime(df['Date'])
+    df = df.sort_values(by = 'Date', ascending = True).reset_index(drop = True)
+
+    return df
 
 
 def aggregated_stats_generator(df, unique_cols):
@@ -100,16 +182,14 @@ def aggregated_stats_generator(df, unique_cols):
 
     Parameters:
     -----------
-    df: dataframe
+    df: dataframe of national daily values
     unique_cols: list
 
     Returns:
     aggregated_stats: dcc.Graph
     '''
 
-    df = df.groupby('Date').sum()
-    df = df.reset_index()
-    df['Date'] = pd.to_datetime(df['Date'])
+    unique_cols = [col for col in unique_cols if col in df.columns]
 
     undisplayed_traces = ['Active', 'Case_Fatality_Ratio', 'Date', 'Incident_Rate', 'Recovered', 'Testing_Rate', 'Total_Test_Results']
 
@@ -138,5 +218,266 @@ def aggregated_stats_generator(df, unique_cols):
 
     return aggregated_stats
 
+def state_series_generator(df, unique_cols):
+    '''
+    Split the dataframe into date sorted numpy arrays per state and column
+    Built once per data version so the state comparison plots never filter the whole dataframe
+
+    Parameters:
+    -----------
+    df: dataframe sorted by date
+    unique_cols: list
+
+    Returns:
+    state_series: dict of state name to dict of column name to numpy array
+    '''
+
+    state_series = {}
+
+    for state, state_df in df.groupby('Province_State', sort = True, observed = True):
+        series = {'Date': state_df['Date'].dt.strftime('%Y-%m-%d').to_numpy()}
+        for col in unique_cols:
+            if col != 'Date':
+                series[col] = state_df[col].to_numpy(dtype = 'float64', na_value = np.nan)
+        state_series[state] = series
+
+    return state_series
+
+
+def line_plot_generator(state_series, states_chosen, col_chosen):
+    '''
+    Generate state comparison line plot
+
+    Parameters:
+    -----------
+    state_series: dict returned by state_series_generator
+    states_chosen: list of state names
+    col_chosen: str
+
+    Returns:
+    fig: plotly figure
+    '''
+
+    fig = go.Figure()
+
+    for state in states_chosen:
+        if state not in state_series:
+            continue
+        fig.add_trace(
+            go.Scatter(
+                x = state_series[state]['Date'],
+                y = state_series[state][col_chosen],
+                name = state,
+                mode = 'lines',
+                hovertemplate = 'Province_State=' + state + '<br>Date=%{x}<br>' + col_chosen + '=%{y}<extra></extra>'
+            )
+        )
+
+    fig.update_layout(
+        title = {'text': '(Log) {} Counts'.format(col_chosen), 'x': 0.5},
+        xaxis = {'title': 'Date'},
+        yaxis = {'title': 'Counts', 'type': 'log'},
+        legend = {'title': 'State'},
+    )
+
+    fig.update_xaxes(
+        rangeslider_visible=True,
+        rangeselector=dict(
+            buttons=list([
+                dict(count=3, label="3m", step="month", stepmode="backward"),
+                dict(count=6, label="6m", step="month", stepmode="backward"),
+                dict(count=1, label="YTD", step="year", stepmode="todate"),
+                dict(count=1, label="1y", step="year", stepmode="backward"),
+                dict(step="all")
+            ])
+        )
+    )
+
+    return fig
+
+# DataTable filter operators, by symbol and by the word DataTable also accepts for it
+filter_operators = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq,
+    'contains': 'contains',
+    'datestartswith': 'datestartswith'
+}
+filter_operator_words = {
+    'ge': '>=',
+    'le': '<=',
+    'ne': '!=',
+    'gt': '>',
+    'lt': '<',
+    'eq': '='
+}
+
+# '{column} operator value', the operator optionally prefixed with i (case-insensitive) or s (case-sensitive)
+filter_part_pattern = re.compile(r'^\s*\{(?P<column>[^{}]+)\}\s+(?P<case>[is]?)(?P<operator>[^\s]+)\s+(?P<value>.*?)\s*$', re.IGNORECASE)
+
+
+def table_columns():
+    '''
+    Columns of the covid data table shown in the data preview
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    columns: list of SQLAlchemy columns, without the surrogate Id
+    '''
+
+    return [column for column in CovidData.__table__.columns if column.name != 'Id']
+
+
+def split_filter_part(filter_part):
+    '''
+    Split one part of a DataTable filter query, e.g. '{Confirmed} >= 1000' or '{Province_State} icontains new'
+
+    Parameters:
+    -----------
+    filter_part: string
+
+    Returns:
+    col_name: string or None if the part couldn't be read
+    filter_op: operator function or the name of a string match
+    case_insensitive: bool, True for operators prefixed with i
+    filter_value: string with any quotes removed
+    '''
+
+    match = filter_part_pattern.match(filter_part)
+    if match is None:
+        return None, None, False, None
+
+    symbol = match.group('operator').lower()
+    filter_op = filter_operators.get(filter_operator_words.get(symbol, symbol))
+    if filter_op is None:
+        return None, None, False, None
+
+    value_part = match.group('value')
+    if len(value_part) > 1 and value_part[0] == value_part[-1] and value_part[0] in ('"', "'", '`'):
+        value_part = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+
+    return match.group('column'), filter_op, match.group('case').lower() == 'i', value_part
+
+
+def table_filter_clauses(filter_query):
+    '''
+    Translate a DataTable filter query into SQL where clauses. Values are bound as parameters.
+    Parts that can't be read, name unknown columns or hold values of the wrong type match no rows,
+    so a filter the table doesn't understand never shows every row.
+    contains and datestartswith match every column as text, dates as 'YYYY-MM-DD',
+    case-insensitive operators compare text in lower case
+
+    Parameters:
+    -----------
+    filter_query: string of parts joined by ' && '
+
+    Returns:
+    clauses: list of SQLAlchemy expressions
+    '''
+
+    columns = {column.name: column for column in table_columns()}
+
+    clauses = []
+    for filter_part in (filter_query or '').split(' && '):
+        if not filter_part.strip():
+            continue
+
+        col_name, filter_op, case_insensitive, filter_value = split_filter_part(filter_part)
+        column = columns.get(col_name)
+        if column is None:
+            clauses.append(false())
+            continue
+
+        # PostgreSQL has no LIKE for numbers or dates, so they are cast to text first
+        python_type = column.type.python_type
+        if python_type is not str:
+            text_column = cast(column, String)
+        elif case_insensitive:
+            column = text_column = func.lower(column, type_ = String)
+            filter_value = filter_value.lower()
+        else:
+            text_column = column
+
+        if filter_op == 'contains':
+            clauses.append(text_column.contains(filter_value, autoescape = True))
+        elif filter_op == 'datestartswith':
+            clauses.append(text_column.startswith(filter_value, autoescape = True))
+        else:
+            try:
+                if python_type in (int, float):
+                    filter_value = float(filter_value)
+                elif python_type is date:
+                    filter_value = date.fromisoformat(filter_value)
+            except ValueError:
+                clauses.append(false())
+                continue
+            clauses.append(filter_op(column, filter_value))
+
+    return clauses
+
+
+def table_page_reader(page_current, page_size, sort_by, filter_query):
+    '''
+    Read one page of the covid data table, filtered and sorted in the database
+
+    Parameters:
+    -----------
+    page_current: int, zero based page number
+    page_size: int
+    sort_by: list of DataTable sort dicts with column_id and direction
+    filter_query: string
+
+    Returns:
+    records: list of row dicts
+    '''
+
+    table = CovidData.__table__
+
+    order_by = [
+        table.c[sort['column_id']].desc() if sort['direction'] == 'desc' else table.c[sort['column_id']].asc()
+        for sort in (sort_by or [])
+        if sort['column_id'] in table.c
+    ]
+
+    # (Date, Province_State) is unique, so ending on it keeps equal sort keys in the same order from page to page
+    query = (
+        select(*table_columns())
+        .where(*table_filter_clauses(filter_query))
+        .order_by(*order_by, table.c.Date, table.c.Province_State)
+        .limit(page_size)
+        .offset(page_current * page_size)
+    )
+
+    with db.engine.connect() as connection:
+        records = [dict(row) for row in connection.execute(query).mappings()]
+
+    return records
+
+
+def table_row_count(filter_query):
+    '''
+    Count the covid data rows matching a DataTable filter query
+
+    Parameters:
+    -----------
+    filter_query: string
+
+    Returns:
+    count: int
+    '''
+
+    query = select(func.count()).select_from(CovidData.__table__).where(*table_filter_clauses(filter_query))
+
+    with db.engine.connect() as connection:
+        count = connection.execute(query).scalar()
+
+    return count
+
 if __name__=='__main__':
     print('This is the dashboard functions file')
\ No newline at end of file
@@ -10,20 +10,72 @@ excluded_states = [
     'Recovered'
 ]
 
-dropped_columns = [
-    'Country_Region',
-    'Last_Update',
-    'Lat',
-    'Long_',
-    'People_Hospitalized',
-    'UID',
-    'ISO3',
-    'Hospitalization_Rate',
-    'People_Tested',
-    'Mortality_Rate',
-    'Recovered',
-    'FIPS'
-]
+# Columns read from the raw csv reports and their parsed dtypes, every other column is skipped
+# Counts are read as floats since some reports write them as 1.0 or leave them empty
+report_dtypes = {
+    'Province_State': 'object',
+    'Confirmed': 'float64',
+    'Deaths': 'float64',
+    'Active': 'float64',
+    'Incident_Rate': 'float64',
+    'Total_Test_Results': 'float64',
+    'Case_Fatality_Ratio': 'float64',
+    'Testing_Rate': 'float64'
+}
+
+# In-memory dtypes of the covid frame
+# Total_Test_Results stays float64 since float32 can't hold counts above 2**24 exactly
+column_dtypes = {
+    'Province_State': 'category',
+    'State_Code': 'category',
+    'Confirmed': 'Int32',
+    'Deaths': 'Int32',
+    'Active': 'float32',
+    'Incident_Rate': 'float32',
+    'Total_Test_Results': 'float64',
+    'Case_Fatality_Ratio': 'float32',
+    'Testing_Rate': 'float32'
+}
+
+# Columns of the national daily aggregate that are plain sums of the state values
+summed_columns = ['Confirmed', 'Deaths', 'Active', 'Total_Test_Results']
+
+
+def national_aggregate(df):
+    '''
+    Aggregate state records into national daily values
+    Counts are summed, per capita rates are weighted by the population implied by each state's
+    incident rate, and the case fatality ratio is recomputed from the national totals
+
+    Parameters:
+    -----------
+    df: Pandas dataframe of state records with a Date column
+
+    Returns:
+    national: Pandas dataframe with one row per date
+    '''
+
+    rate_columns = ['Incident_Rate', 'Testing_Rate']
+    df = df.reindex(columns = ['Date'] + summed_columns + rate_columns)
+    df[summed_columns + rate_columns] = df[summed_columns + rate_columns].astype('float64')
+
+    # Incident_Rate is cases per 100,000 persons
+    population = (df['Confirmed'] * 100000 / df['Incident_Rate']).where(df['Incident_Rate'] > 0)
+    df['Rated_Confirmed'] = df['Confirmed'].where(population.notna())
+    df['Population'] = population
+    df['Rated_Tests'] = df['Testing_Rate'] * population / 100000
+    df['Tested_Population'] = population.where(df['Testing_Rate'].notna())
+
+    grouped = df.groupby('Date', sort = True)
+    sums = grouped[summed_columns + ['Rated_Confirmed', 'Population', 'Rated_Tests', 'Tested_Population']].sum(min_count = 1)
+
+    national = sums[summed_columns].copy()
+    national['Incident_Rate'] = sums['Rated_Confirmed'] * 100000 / sums['Population'].where(sums['Population'] > 0)
+    national['Testing_Rate'] = sums['Rated_Tests'] * 100000 / sums['Tested_Population'].where(sums['Tested_Population'] > 0)
+    national['Case_Fatality_Ratio'] = sums['Deaths'] * 100 / sums['Confirmed'].where(sums['Confirmed'] > 0)
+    national = national.reset_index()
+
+    return national
 
 
 us_state_abbrev = {
@@ -0,0 +1,487 @@
+import io
+import os
+import csv
+import gzip
+import json
+import shutil
+import hashlib
+import threading
+from datetime import date
+from flask import request, send_file, abort
+from sqlalchemy import select
+from app import db, CovidData
+from data_snapshot import read_version
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Export Settings
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 5000))
+EXPORT_GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL', 6))
+EXPORT_MAX_SLICES = int(os.environ.get('EXPORT_MAX_SLICES', 64))
+
+export_formats = {
+    'csv': {'label': 'CSV (gzip)', 'extension': '.csv.gz', 'mimetype': 'application/gzip'},
+    'jsonl': {'label': 'JSON Lines (gzip)', 'extension': '.jsonl.gz', 'mimetype': 'application/gzip'},
+    'parquet': {'label': 'Parquet', 'extension': '.parquet', 'mimetype': 'application/octet-stream'},
+}
+
+# Arrow types of the exported columns by python type of the database column
+arrow_types = {
+    str: 'string',
+    int: 'int64',
+    float: 'float64',
+    date: 'date32',
+}
+
+# Serializes building artifacts within a process, finished artifacts are served without it
+_build_lock = threading.Lock()
+
+
+def available_formats():
+    '''
+    Export formats that can be built with the installed packages
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    formats: list of export format names
+    '''
+
+    return [fmt for fmt in export_formats if (fmt != 'parquet') or (pa is not None)]
+
+
+def export_columns():
+    '''
+    Columns of the covid data table included in exports
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    columns: list of SQLAlchemy columns, without the surrogate Id
+    '''
+
+    return [column for column in CovidData.__table__.columns if column.name != 'Id']
+
+
+def export_query(states = None, start = None, end = None):
+    '''
+    Select the exported rows, optionally limited to some states and a date range
+
+    Parameters:
+    -----------
+    states: list of state names, all states if empty
+    start: datetime.date of the first date, unbounded if None
+    end: datetime.date of the last date, unbounded if None
+
+    Returns:
+    query: SQLAlchemy select ordered by date and state
+    '''
+
+    query = select(*export_columns()).order_by(CovidData.Date, CovidData.Province_State)
+
+    if states:
+        query = query.where(CovidData.Province_State.in_(states))
+    if start is not None:
+        query = query.where(CovidData.Date >= start)
+    if end is not None:
+        query = query.where(CovidData.Date <= end)
+
+    return query
+
+
+def row_chunks(engine, query, chunk_rows = EXPORT_CHUNK_ROWS):
+    '''
+    Read query results through a server side cursor, chunk_rows rows at a time
+    Only one chunk of rows is held in memory regardless of the size of the table
+
+    Parameters:
+    -----------
+    engine: database engine
+    query: SQLAlchemy select
+    chunk_rows: int number of rows fetched per chunk
+
+    Returns:
+    generator of lists of rows
+    '''
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results = True, max_row_buffer = chunk_rows).execute(query)
+
+        for rows in result.partitions(chunk_rows):
+            yield rows
+
+
+def write_csv(chunks, file, column_names):
+    '''
+    Write chunks of rows as gzip compressed csv with a header
+
+    Parameters:
+    -----------
+    chunks: iterable of lists of rows
+    file: binary file object
+    column_names: list of strings
+
+    Returns:
+    None
+    '''
+
+    # A fixed mtime keeps the bytes, and so the content hash, the same for the same rows
+    with gzip.GzipFile(fileobj = file, mode = 'wb', compresslevel = EXPORT_GZIP_LEVEL, mtime = 0) as gz:
+        text = io.TextIOWrapper(gz, encoding = 'utf-8', newline = '')
+        writer = csv.writer(text, lineterminator = '\n')
+        writer.writerow(column_names)
+        for rows in chunks:
+            writer.writerows(rows)
+        text.flush()
+        text.detach()
+
+    return None
+
+
+def write_jsonl(chunks, file, column_names):
+    '''
+    Write chunks of rows as gzip compressed JSON lines, one object per row
+
+    Parameters:
+    -----------
+    chunks: iterable of lists of rows
+    file: binary file object
+    column_names: list of strings
+
+    Returns:
+    None
+    '''
+
+    with gzip.GzipFile(fileobj = file, mode = 'wb', compresslevel = EXPORT_GZIP_LEVEL, mtime = 0) as gz:
+        for rows in chunks:
+            lines = [json.dumps(dict(zip(column_names, row)), default = date.isoformat) for row in rows]
+            gz.write(('\n'.join(lines) + '\n').encode())
+
+    return None
+
+
+def write_parquet(chunks, file, column_names):
+    '''
+    Write chunks of rows as a parquet file with one row group per chunk
+
+    Parameters:
+    -----------
+    chunks: iterable of lists of rows
+    file: binary file object
+    column_names: list of strings
+
+    Returns:
+    None
+    '''
+
+    columns = {column.name: column for column in export_columns()}
+    schema = pa.schema([
+        (name, getattr(pa, arrow_types[columns[name].type.python_type])())
+        for name in column_names
+    ])
+
+    with pq.ParquetWriter(file, schema) as writer:
+        for rows in chunks:
+            values = list(zip(*rows))
+            writer.write_table(pa.table(
+                [pa.array(values[i], type = field.type) for i, field in enumerate(schema)],
+                schema = schema
+            ))
+
+    return None
+
+
+export_writers = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet,
+}
+
+
+def version_directory(version, directory = EXPORT_DIR):
+    '''
+    Directory holding the export artifacts of one data version
+
+    Parameters:
+    -----------
+    version: string data version from read_version
+    directory: string root export directory
+
+    Returns:
+    path: string
+    '''
+
+    return os.path.join(directory, hashlib.sha256(version.encode()).hexdigest()[:16])
+
+
+def slice_name(states = None, start = None, end = None):
+    '''
+    File name, without extension, of the artifact for a state and date filter
+
+    Parameters:
+    -----------
+    states: list of state names
+    start: datetime.date or None
+    end: datetime.date or None
+
+    Returns:
+    name: string, 'data' for the whole table
+    '''
+
+    if not (states or start or end):
+        return 'data'
+
+    key = json.dumps([sorted(states or []), str(start), str(end)])
+
+    return 'data-' + hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def file_hash(path):
+    '''
+    sha256 of a file, read in blocks
+
+    Parameters:
+    -----------
+    path: string
+
+    Returns:
+    content_hash: string
+    '''
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def build_artifact(engine, path, fmt, query):
+    '''
+    Write one export artifact and its content hash next to it
+    Both are written to temporary files first, so readers only ever see complete artifacts
+
+    Parameters:
+    -----------
+    engine: database engine
+    path: string path of the artifact
+    fmt: string export format
+    query: SQLAlchemy select from export_query
+
+    Returns:
+    content_hash: string sha256 of the artifact
+    '''
+
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        column_names = [column.name for column in query.selected_columns]
+        export_writers[fmt](row_chunks(engine, query), file, column_names)
+
+    content_hash = file_hash(tmp_path)
+    with open(tmp_path + '.sha256', 'w') as file:
+        file.write(content_hash)
+
+    os.replace(tmp_path + '.sha256', path + '.sha256')
+    os.replace(tmp_path, path)
+
+    return content_hash
+
+
+def prune_slices(directory, max_slices = EXPORT_MAX_SLICES):
+    '''
+    Remove the least recently built filtered artifacts beyond max_slices
+    Whole table artifacts are always kept
+
+    Parameters:
+    -----------
+    directory: string version directory
+    max_slices: int
+
+    Returns:
+    None
+    '''
+
+    slices = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith('data-') and not name.endswith(('.sha256', '.tmp'))
+    ]
+    slices.sort(key = os.path.getmtime, reverse = True)
+
+    for path in slices[max_slices:]:
+        for stale_path in (path, path + '.sha256'):
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+
+    return None
+
+
+def prune_versions(current, directory = EXPORT_DIR):
+    '''
+    Remove the artifacts of older data versions, keeping the most recent one for downloads in progress
+
+    Parameters:
+    -----------
+    current: string version directory in use
+    directory: string root export directory
+
+    Returns:
+    None
+    '''
+
+    older = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.join(directory, name) != current
+    ]
+    older.sort(key = os.path.getmtime, reverse = True)
+
+    for path in older[1:]:
+        shutil.rmtree(path, ignore_errors = True)
+
+    return None
+
+
+def artifact_path(version, fmt, states = None, start = None, end = None, directory = EXPORT_DIR):
+    '''
+    Path of the artifact for a data version, format and filter, whether or not it was built
+
+    Parameters:
+    -----------
+    version: string data version from read_version
+    fmt: string export format
+    states: list of state names
+    start: datetime.date or None
+    end: datetime.date or None
+    directory: string root export directory
+
+    Returns:
+    path: string path of the artifact
+    '''
+
+    return os.path.join(version_directory(version, directory), slice_name(states, start, end) + export_formats[fmt]['extension'])
+
+
+def export_artifact(engine, version, fmt, states = None, start = None, end = None, directory = EXPORT_DIR):
+    '''
+    Find the artifact for a data version, format and filter, building it on the first request
+
+    Parameters:
+    -----------
+    engine: database engine
+    version: string data version from read_version
+    fmt: string export format
+    states: list of state names
+    start: datetime.date or None
+    end: datetime.date or None
+    directory: string root export directory
+
+    Returns:
+    path: string path of the artifact
+    content_hash: string sha256 of the artifact
+    '''
+
+    folder = version_directory(version, directory)
+    path = artifact_path(version, fmt, states, start, end, directory)
+
+    if not os.path.exists(path):
+        with _build_lock:
+            if not os.path.exists(path):
+                new_version = not os.path.isdir(folder)
+                build_artifact(engine, path, fmt, export_query(states, start, end))
+                prune_slices(folder)
+                if new_version:
+                    prune_versions(folder, directory)
+
+    with open(path + '.sha256') as file:
+        content_hash = file.read()
+
+    return path, content_hash
+
+
+def publish_exports(engine, directory = EXPORT_DIR):
+    '''
+    Build the whole table artifacts for the current data version in every available format not built yet
+
+    Parameters:
+    -----------
+    engine: database engine
+    directory: string root export directory
+
+    Returns:
+    None
+    '''
+
+    version = read_version(engine)
+    if version is None:
+        return None
+
+    missing = [fmt for fmt in available_formats() if not os.path.exists(artifact_path(version, fmt, directory = directory))]
+    if not missing:
+        return None
+
+    for fmt in missing:
+        export_artifact(engine, version, fmt, directory = directory)
+
+    print('Published data exports {} ({})'.format(version, ', '.join(missing)))
+
+    return None
+
+
+def serve_export(fmt):
+    '''
+    Send the export artifact for the format and the state/date filter in the query string,
+    e.g. ?state=Texas&state=Ohio&start=2021-01-01&end=2021-06-30
+    Browsers revalidate with If-None-Match, and interrupted downloads resume with Range requests
+
+    Parameters:
+    -----------
+    fmt: string export format
+
+    Returns:
+    response: flask Response
+    '''
+
+    if fmt not in available_formats():
+        abort(404)
+
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        abort(400)
+
+    version = read_version()
+    if version is None:
+        abort(503)
+
+    states = sorted(set(request.args.getlist('state')))
+    path, content_hash = export_artifact(db.engine, version, fmt, states, start, end)
+
+    response = send_file(
+        path,
+        mimetype = export_formats[fmt]['mimetype'],
+        as_attachment = True,
+        download_name = 'data' + export_formats[fmt]['extension'],
+        conditional = True,
+        etag = content_hash
+    )
+    response.cache_control.no_cache = True
+
+    return response
+
+
+if __name__ == '__main__':
+    print('This is the data export file')
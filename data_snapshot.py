@@ -0,0 +1,170 @@
+import os
+import tempfile
+import pandas as pd
+from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, CovidData, CovidManifest
+from data_clean.data_cleaning import column_dtypes
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+
+
+# Columnar copy of covid_data published by ingest and memory-mapped by web workers on startup
+SNAPSHOT_PATH = os.environ.get('DATA_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'covid_data.feather'))
+VERSION_KEY = b'covid_data_version'
+
+
+def read_version(engine = None):
+    '''
+    Read a cheap marker that changes whenever ingest loads or reloads a report
+    Ingest passes its write engine, so the version it publishes isn't read from a lagging replica
+
+    Parameters:
+    -----------
+    engine: database engine, db.engine if None
+
+    Returns:
+    version: string, None if the manifest can't be read
+    '''
+
+    if engine is None:
+        engine = db.engine
+
+    try:
+        with engine.connect() as connection:
+            row_count, loaded_at = connection.execute(
+                select(func.count(), func.max(CovidManifest.Loaded_At))
+            ).first()
+    except SQLAlchemyError:
+        return None
+
+    version = '{}:{}'.format(row_count, loaded_at)
+
+    return version
+
+
+def snapshot_version(path = SNAPSHOT_PATH):
+    '''
+    Read the data version a snapshot was published at without loading its data
+
+    Parameters:
+    -----------
+    path: string path of the snapshot file
+
+    Returns:
+    version: string, None if there is no readable snapshot
+    '''
+
+    if (pa is None) or (not os.path.exists(path)):
+        return None
+
+    try:
+        metadata = feather.read_table(path, memory_map = True).schema.metadata or {}
+    except (OSError, pa.ArrowException):
+        return None
+
+    version = metadata.get(VERSION_KEY)
+
+    return version.decode() if version is not None else None
+
+
+def write_snapshot(df, version, path = SNAPSHOT_PATH):
+    '''
+    Write covid_data to a feather file tagged with its data version
+    Columns are stored with the compact in-memory dtypes and dates as native dates
+    The file is written next to the target and renamed into place so readers never see a partial file
+
+    Parameters:
+    -----------
+    df: Pandas dataframe of covid_data without the Id column
+    version: string data version df was read at
+    path: string path of the snapshot file
+
+    Returns:
+    None
+    '''
+
+    if pa is None:
+        return None
+
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'])
+    df = df.astype({col: dtype for col, dtype in column_dtypes.items() if col in df.columns})
+
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), VERSION_KEY: version.encode()})
+
+    # Every writer gets its own temporary file, since several web workers may publish at once
+    fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)), suffix = '.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(table, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return None
+
+
+def read_snapshot(version, path = SNAPSHOT_PATH):
+    '''
+    Memory-map the snapshot if it was published at the given data version
+
+    Parameters:
+    -----------
+    version: string data version the caller expects
+    path: string path of the snapshot file
+
+    Returns:
+    df: Pandas dataframe, None if the snapshot is missing or stale
+    '''
+
+    if (pa is None) or (version is None) or (not os.path.exists(path)):
+        return None
+
+    try:
+        table = feather.read_table(path, memory_map = True)
+    except (OSError, pa.ArrowException):
+        return None
+
+    metadata = table.schema.metadata or {}
+    if metadata.get(VERSION_KEY) != version.encode():
+        return None
+
+    df = table.to_pandas()
+
+    return df
+
+
+def publish_snapshot(connection, path = SNAPSHOT_PATH):
+    '''
+    Publish a snapshot of covid_data unless one already exists for the current data version
+
+    Parameters:
+    -----------
+    connection: database connection
+    path: string path of the snapshot file
+
+    Returns:
+    None
+    '''
+
+    version = read_version(connection)
+    if (pa is None) or (version is None) or (snapshot_version(path) == version):
+        return None
+
+    df = pd.read_sql(select(CovidData.__table__), con = connection)
+    df = df.drop(['Id'], axis=1)
+    write_snapshot(df, version, path)
+    print('Published data snapshot {}'.format(version))
+
+    return None
+
+
+if __name__ == '__main__':
+    print('This is the data snapshot file')
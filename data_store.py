@@ -0,0 +1,256 @@
+import time
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+import pandas as pd
+from dashboard_functions import data_reader, prepare_frame
+from data_snapshot import read_version, read_snapshot, write_snapshot
+
+
+@dataclass(frozen = True)
+class DataSnapshot:
+    '''
+    One fully built copy of the covid data shared by every page in the process
+    Snapshots are replaced as a whole and never modified, so callers must treat the frames as read-only
+
+    Attributes:
+    -----------
+    frame: Pandas dataframe of every record, sorted by date
+    loaded_at: datetime the snapshot was built
+    version: data version the snapshot was loaded at
+    derived: values built from this snapshot by registered builders, e.g. page layouts
+    '''
+
+    frame: pd.DataFrame
+    loaded_at: datetime
+    version: str = None
+    derived: dict = field(default_factory = dict)
+
+
+def load_frame(version):
+    '''
+    Load the covid data for a data version, preferring the published snapshot and falling back to SQL
+    Data read from SQL is written to the snapshot for the next process
+
+    Parameters:
+    -----------
+    version: string data version to load
+
+    Returns:
+    df: Pandas dataframe
+    '''
+
+    df = read_snapshot(version)
+    if df is not None:
+        return prepare_frame(df)
+
+    df = data_reader()
+
+    # Ingest usually runs on another dyno, so the first worker to fall back to SQL publishes
+    # the snapshot its sibling workers and later restarts load instead
+    if version is not None:
+        try:
+            write_snapshot(df.drop(columns = ['State_Code']), version)
+        except Exception as e:
+            print('Could not write the data snapshot: {}'.format(e))
+
+    return df
+
+
+def build_snapshot(df, version = None):
+    '''
+    Wrap a dataframe in a new snapshot, its derived values are built later as they are asked for
+
+    Parameters:
+    -----------
+    df: dataframe returned by data_reader
+    version: data version df was loaded at
+
+    Returns:
+    snapshot: DataSnapshot
+    '''
+
+    snapshot = DataSnapshot(
+        frame = df,
+        loaded_at = datetime.utcnow(),
+        version = version
+    )
+
+    return snapshot
+
+
+class DataStore:
+    '''
+    Process-wide holder of the current DataSnapshot
+    The table is read once per process on first use and derived values are built the first time
+    they are asked for, so a page nobody visits never pays for its figures. A refresh rebuilds the
+    derived values already in use before swapping the new snapshot in, so readers always see a complete one
+    '''
+
+    def __init__(self, loader, version_reader):
+        self._loader = loader
+        self._version_reader = version_reader
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot = None
+        self._builders = {}
+        self.refresh_count = 0
+        self.last_refresh_seconds = None
+        self.last_refreshed_at = None
+
+    def register(self, name, builder):
+        '''
+        Register a value derived from a snapshot, built at most once per data version
+
+        Parameters:
+        -----------
+        name: str
+        builder: function taking a DataSnapshot
+
+        Returns:
+        None
+        '''
+
+        self._builders[name] = builder
+
+    def get(self):
+        '''
+        Return the current snapshot, loading it on first use
+
+        Returns:
+        snapshot: DataSnapshot
+        '''
+
+        if self._snapshot is None:
+            self.refresh(only_if_empty = True)
+
+        return self._snapshot
+
+    def derived(self, name, snapshot = None):
+        '''
+        Return a registered value for a snapshot, building it if it isn't ready yet
+
+        Parameters:
+        -----------
+        name: str
+        snapshot: DataSnapshot, defaults to the current one
+
+        Returns:
+        value returned by the builder
+        '''
+
+        if snapshot is None:
+            snapshot = self.get()
+        if name not in snapshot.derived:
+            with self._lock:
+                if name not in snapshot.derived:
+                    snapshot.derived[name] = self._builders[name](snapshot)
+
+        return snapshot.derived[name]
+
+    def refresh(self, only_if_empty = False):
+        '''
+        Load the table again and atomically replace the current snapshot
+
+        Parameters:
+        -----------
+        only_if_empty: bool skip the refresh if another thread already loaded a snapshot
+
+        Returns:
+        snapshot: DataSnapshot
+        '''
+
+        with self._refresh_lock:
+            if only_if_empty and self._snapshot is not None:
+                return self._snapshot
+
+            start = time.perf_counter()
+
+            # Read the version first so a load that races with ingest is picked up again on the next poll
+            version = self._version_reader()
+            snapshot = build_snapshot(self._loader(version), version)
+
+            previous = self._snapshot
+            if previous is not None:
+                for name, builder in list(self._builders.items()):
+                    if name in previous.derived:
+                        snapshot.derived[name] = builder(snapshot)
+
+            with self._lock:
+                self._snapshot = snapshot
+
+            self.refresh_count += 1
+            self.last_refresh_seconds = time.perf_counter() - start
+            self.last_refreshed_at = snapshot.loaded_at
+
+        return snapshot
+
+    def refresh_if_changed(self):
+        '''
+        Refresh the snapshot if the data version moved since it was loaded
+        A process that hasn't loaded the data yet is left alone, it loads the current version on first use
+
+        Returns:
+        bool whether a refresh happened
+        '''
+
+        if self._snapshot is None:
+            return False
+
+        version = self._version_reader()
+        if (version is None) or (version == self._snapshot.version):
+            return False
+
+        self.refresh()
+        return True
+
+    def start_polling(self, interval):
+        '''
+        Check the data version every interval seconds in a daemon thread
+
+        Parameters:
+        -----------
+        interval: float seconds between checks
+
+        Returns:
+        thread: threading.Thread
+        '''
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_if_changed()
+                except Exception as e:
+                    print('Data refresh failed: {}'.format(e))
+
+        thread = threading.Thread(target = poll, name = 'data-store-poller', daemon = True)
+        thread.start()
+
+        return thread
+
+    def metrics(self):
+        '''
+        Report the state of the store
+
+        Returns:
+        metrics: dict
+        '''
+
+        snapshot = self._snapshot
+        metrics = {
+            'version': snapshot.version if snapshot else None,
+            'rows': len(snapshot.frame) if snapshot else 0,
+            'refresh_count': self.refresh_count,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'last_refreshed_at': self.last_refreshed_at.isoformat() if self.last_refreshed_at else None
+        }
+
+        return metrics
+
+
+store = DataStore(load_frame, read_version)
+
+
+if __name__ == '__main__':
+    print('This is the shared data store file')
@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+from dataclasses import dataclass
+from flask import request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+@dataclass(frozen = True)
+class FigureAsset:
+    '''
+    A figure rendered once to json, kept in compressed form
+
+    Attributes:
+    -----------
+    etag: string strong entity tag of the uncompressed bytes
+    raw: bytes of the uncompressed json
+    encoded: dict of content encoding to compressed bytes
+    '''
+
+    etag: str
+    raw: bytes
+    encoded: dict
+
+
+def render_figure_asset(fig):
+    '''
+    Render a plotly figure to json and compress it
+    The json only depends on the figure, so every process renders the same bytes and the same ETag
+
+    Parameters:
+    -----------
+    fig: plotly figure
+
+    Returns:
+    asset: FigureAsset
+    '''
+
+    raw = fig.to_json().encode()
+
+    return compress_asset(raw)
+
+
+def compress_asset(raw):
+    '''
+    Compress a static asset once with every supported encoding
+
+    Parameters:
+    -----------
+    raw: bytes of the asset
+
+    Returns:
+    asset: FigureAsset
+    '''
+
+    encoded = {'gzip': gzip.compress(raw, compresslevel = 9)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(raw, quality = 11)
+
+    asset = FigureAsset(
+        etag = hashlib.sha256(raw).hexdigest()[:32],
+        raw = raw,
+        encoded = encoded
+    )
+
+    return asset
+
+
+def serve_figure_asset(asset, mimetype = 'application/json', max_age = 86400):
+    '''
+    Build a response for a figure asset
+    Browsers revalidate with If-None-Match and get a 304 while the figure is unchanged,
+    otherwise the best encoding they accept is sent
+
+    Parameters:
+    -----------
+    asset: FigureAsset
+    mimetype: string
+    max_age: int seconds browsers may use the asset without revalidating
+
+    Returns:
+    response: flask Response
+    '''
+
+    headers = {
+        'ETag': '"{}"'.format(asset.etag),
+        'Cache-Control': 'public, max-age={}'.format(max_age),
+        'Vary': 'Accept-Encoding'
+    }
+
+    if asset.etag in request.if_none_match:
+        return Response(status = 304, headers = headers)
+
+    for encoding in ('br', 'gzip'):
+        if (encoding in asset.encoded) and (encoding in request.accept_encodings):
+            headers['Content-Encoding'] = encoding
+            return Response(asset.encoded[encoding], mimetype = mimetype, headers = headers)
+
+    return Response(asset.raw, mimetype = mimetype, headers = headers)
+
+
+if __name__ == '__main__':
+    print('This is the figure assets file')
@@ -0,0 +1,85 @@
+import json
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    '''
+    Least recently used cache of serialized plotly figures, bounded by the total size of the stored json
+    Entries belong to one data version and the whole cache is dropped when a different version is requested
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, version, key, builder):
+        '''
+        Return the cached figure for key, building and storing it on a miss
+
+        Parameters:
+        -----------
+        version: data version the figure is built from
+        key: hashable key of the figure
+        builder: function returning a plotly figure
+
+        Returns:
+        figure: dict of the figure json
+        '''
+
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                self.size_bytes = 0
+
+            figure_json = self._entries.get(key)
+            if figure_json is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(figure_json)
+
+            self.misses += 1
+
+        figure_json = builder().to_json()
+
+        with self._lock:
+            if (version == self._version) and (key not in self._entries) and (len(figure_json) <= self.max_bytes):
+                self._entries[key] = figure_json
+                self.size_bytes += len(figure_json)
+
+                while self.size_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last = False)
+                    self.size_bytes -= len(evicted)
+                    self.evictions += 1
+
+        return json.loads(figure_json)
+
+    def metrics(self):
+        '''
+        Report cache counters
+
+        Returns:
+        metrics: dict
+        '''
+
+        metrics = {
+            'entries': len(self._entries),
+            'size_bytes': self.size_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+        return metrics
+
+
+if __name__ == '__main__':
+    print('This is the figure cache file')
@@ -0,0 +1,108 @@
+import os
+import hashlib
+import argparse
+from datetime import timedelta
+from email.utils import formatdate
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from listing import FIRST_REPORT_DATE
+
+
+# One listing row, shaped like the rows of the GitHub tree page
+listing_row = '''
+<div role="row" class="Box-row Box-row--focus-gray py-2 d-flex position-relative js-navigation-item">
+  <div role="gridcell" class="mr-3 flex-shrink-0" style="width: 16px;">
+    <svg aria-label="File" aria-hidden="true" height="16" viewBox="0 0 16 16" version="1.1" width="16" class="octicon octicon-file color-fg-muted"><path fill-rule="evenodd" d="M3.75 1.5a.25.25 0 00-.25.25v11.5c0 .138.112.25.25.25h8.5a.25.25 0 00.25-.25V6H9.75A1.75 1.75 0 018 4.25V1.5H3.75zm5.75.56v2.19c0 .138.112.25.25.25h2.19L9.5 2.06z"></path></svg>
+  </div>
+  <div role="rowheader" class="flex-auto min-width-0 col-md-2 mr-3">
+    <span class="css-truncate css-truncate-target d-block width-fit"><a class="js-navigation-open Link--primary" title="{name}" data-pjax="#repo-content-pjax-container" href="/CSSEGISandData/COVID-19/blob/master/csse_covid_19_data/csse_covid_19_daily_reports_us/{name}">{name}</a></span>
+  </div>
+  <div role="gridcell" class="flex-auto min-width-0 d-none d-md-block col-5 mr-3">
+    <span class="css-truncate css-truncate-target d-block width-fit Link--secondary"><a data-pjax="true" title="automated update" class="Link--secondary" href="/CSSEGISandData/COVID-19/commit/0000000000000000000000000000000000000000">automated update</a></span>
+  </div>
+  <div role="gridcell" class="color-fg-muted text-right" style="width:100px;">
+    <time-ago datetime="2021-12-28T05:53:43Z" class="no-wrap">Dec 28, 2021</time-ago>
+  </div>
+</div>'''
+
+
+def listing_page(directory, days):
+    '''
+    Build a listing page of the report files in a directory, or of days synthetic daily reports
+
+    Parameters:
+    -----------
+    directory: string directory of csv reports
+    days: int number of daily reports to list, the directory contents if 0
+
+    Returns:
+    page: bytes of html
+    '''
+
+    if days:
+        names = [(FIRST_REPORT_DATE + timedelta(days = day)).strftime('%m-%d-%Y') + '.csv' for day in range(days)]
+    else:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.csv'))
+
+    rows = ''.join(listing_row.format(name = name) for name in ['README.md'] + names)
+    page = '<html><head><title>COVID-19 daily reports</title></head><body><div role="grid">{}</div></body></html>'.format(rows)
+
+    return page.encode()
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    '''
+    Serves the csv reports in a directory and a listing page of them at /listing
+    The listing honours If-None-Match and If-Modified-Since like GitHub does
+    '''
+
+    def __init__(self, *args, listing = b'', listing_modified = 0, **kwargs):
+        self.listing = listing
+        self.etag = '"{}"'.format(hashlib.sha256(listing).hexdigest()[:32])
+        self.last_modified = formatdate(listing_modified, usegmt = True)
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/listing':
+            return super().do_GET()
+
+        not_modified = (
+            (self.headers.get('If-None-Match') == self.etag)
+            or (self.headers.get('If-None-Match') is None and self.headers.get('If-Modified-Since') == self.last_modified)
+        )
+
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Last-Modified', self.last_modified)
+        if not_modified:
+            self.end_headers()
+            return None
+
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.listing)))
+        self.end_headers()
+        self.wfile.write(self.listing)
+
+        return None
+
+    def log_message(self, format, *args):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Serve local csv reports and a GitHub style listing of them for ingest runs and timings')
+    parser.add_argument('directory', help = 'directory of MM-DD-YYYY.csv reports')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--days', type = int, default = 0, help = 'list this many synthetic daily reports instead of the directory contents')
+    args = parser.parse_args()
+
+    handler = partial(
+        FixtureHandler,
+        directory = args.directory,
+        listing = listing_page(args.directory, args.days),
+        listing_modified = os.path.getmtime(args.directory)
+    )
+
+    print('Listing at http://127.0.0.1:{}/listing'.format(args.port))
+    print('Reports at http://127.0.0.1:{}/'.format(args.port))
+    ThreadingHTTPServer(('127.0.0.1', args.port), handler).serve_forever()
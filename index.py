@@ -1,10 +1,26 @@
+import os
 import dash_bootstrap_components as dbc
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 
-from app import app
+from flask import jsonify
+from app import app, db
 from apps import home, dashboard, datapreview
 from app import server #not used in file but necessary for heroku deployment
+from data_store import store
+from database import database_metrics
+
+
+# Optionally keep the database updated from inside the web process
+# Only one worker runs the update at a time, the rest keep serving the data already in the database
+if os.environ.get('INGEST_INTERVAL'):
+    from ingest import start_scheduler
+    start_scheduler(float(os.environ['INGEST_INTERVAL']))
+
+# Pick up data loaded by ingest without restarting the web process
+DATA_REFRESH_INTERVAL = float(os.environ.get('DATA_REFRESH_INTERVAL', 300))
+if DATA_REFRESH_INTERVAL > 0:
+    store.start_polling(DATA_REFRESH_INTERVAL)
 
 
 # Create navbar, error page
@@ -98,7 +114,7 @@ def display_page(pathname):
     elif pathname == '/data-preview':
         return datapreview.layout
     elif pathname == '/dashboard':
-        return dashboard.layout
+        return dashboard.layout()
     else:
         return error_page
 
@@ -114,6 +130,16 @@ def toggle_navbar_collapse(n, is_open):
     return is_open
 
 
+# Data Store Status
+@server.route('/data-status')
+def data_status():
+    return jsonify({
+        **store.metrics(),
+        'figure_cache': dashboard.line_plot_cache.metrics(),
+        'database_pools': database_metrics(db.engine)
+    })
+
+
 # App Layout
 app.layout = html.Div(
     children=[
@@ -0,0 +1,516 @@
+import io
+import os
+import time
+import fcntl
+import hashlib
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text, select, delete, func, Integer, Date
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+from data_clean.data_cleaning import national_aggregate
+from app import db, CovidData, CovidManifest, CovidNationalDaily
+from data_snapshot import publish_snapshot
+from data_export import publish_exports
+from migrate import migrate_database
+from database import write_engine
+from sources import data_source, DATA_SOURCE, DATA_SOURCE_PATH, DATA_SOURCE_REF
+from report_parsing import report_date, parse_reports, PARSE_WORKERS
+from listing import REPORT_FREQUENCY
+
+
+# Ingest Settings
+INGEST_BATCH_REPORTS = int(os.environ.get('INGEST_BATCH_REPORTS', 32))
+
+
+def build_batch(reports, start_id = 0):
+    '''
+    Concatenate cleaned reports into a single dataframe in one pass
+    Reports are ordered by date and rows are given consecutive Ids starting at start_id
+
+    Parameters:
+    -----------
+    reports: list of (date, tmp_df) tuples
+    start_id: int Id of the first row in the batch
+
+    Returns:
+    df: Pandas dataframe
+    '''
+
+    if not reports:
+        return pd.DataFrame()
+
+    reports = sorted(reports, key = lambda report: report_date(report[0]))
+    df = pd.concat([tmp_df for _, tmp_df in reports], ignore_index = True)
+    df.insert(0, 'Id', range(start_id, start_id + len(df)))
+
+    return df
+
+
+def bulk_insert(transaction, df, table):
+    '''
+    Insert a dataframe into a table inside an open transaction
+    PostgreSQL streams the rows through COPY FROM STDIN from an in-memory csv buffer,
+    other databases fall back to a single executemany insert
+
+    Parameters:
+    -----------
+    transaction: open database connection with a transaction in progress
+    df: Pandas dataframe
+    table: SQLAlchemy table to insert into
+
+    Returns:
+    None
+    '''
+
+    columns = [col for col in df.columns if col in table.columns]
+    df = df[columns].copy()
+
+    # Float columns holding whole numbers would be written as 1.0, which integer columns reject
+    for col in columns:
+        if isinstance(table.columns[col].type, Integer):
+            df[col] = df[col].round().astype('Int64')
+        elif isinstance(table.columns[col].type, Date):
+            df[col] = pd.to_datetime(df[col]).dt.date
+
+    if transaction.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        df.to_csv(buffer, index = False, header = False)
+        buffer.seek(0)
+
+        quote = transaction.dialect.identifier_preparer.quote
+        copy_sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            quote(table.name),
+            ', '.join(quote(col) for col in columns)
+        )
+
+        cursor = transaction.connection.cursor()
+        try:
+            cursor.copy_expert(copy_sql, buffer)
+        finally:
+            cursor.close()
+
+    else:
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+        transaction.execute(table.insert(), records)
+
+    return None
+
+
+def read_manifest(connection):
+    '''
+    Read the dates already loaded into covid_data along with their row counts and content hashes
+    A database filled before the manifest existed is backfilled from covid_data once,
+    with unknown content hashes
+
+    Parameters:
+    -----------
+    connection: database connection
+
+    Returns:
+    manifest: Pandas dataframe
+    '''
+
+    manifest = pd.read_sql(select(CovidManifest.__table__), con = connection)
+
+    if manifest.empty:
+        loaded_dates = pd.read_sql(
+            select(CovidData.Date, func.count().label('Row_Count')).group_by(CovidData.Date),
+            con = connection
+        )
+
+        if not loaded_dates.empty:
+            loaded_dates['Content_Hash'] = None
+            loaded_dates['Loaded_At'] = datetime.utcnow()
+            loaded_dates.to_sql('covid_manifest', con = connection, if_exists = 'append', index = False)
+            manifest = loaded_dates
+
+    return manifest
+
+
+def backfill_national_daily(connection):
+    '''
+    Build the national daily aggregate from covid_data if it has never been built
+    Afterwards fill_database keeps it up to date for every date it loads
+
+    Parameters:
+    -----------
+    connection: database connection
+
+    Returns:
+    None
+    '''
+
+    with connection.begin() as transaction:
+        if transaction.execute(select(func.count()).select_from(CovidNationalDaily.__table__)).scalar() > 0:
+            return None
+
+        df = pd.read_sql(select(CovidData.__table__), con = transaction)
+        if not df.empty:
+            bulk_insert(transaction, national_aggregate(df), CovidNationalDaily.__table__)
+            print('Built covid_national_daily from covid_data')
+
+    return None
+
+
+def write_batch(connection, reports, content_hashes, loaded_hashes):
+    '''
+    Write a batch of cleaned reports in its own transaction
+    Changed dates are replaced and their manifest entries recorded in the same transaction as the rows,
+    so a run that stops part way leaves every committed batch complete and the next run carries on from there
+
+    Parameters:
+    -----------
+    connection: database connection
+    reports: list of (date, tmp_df) tuples of cleaned reports
+    content_hashes: dict of date to content hash of the raw report
+    loaded_hashes: dict of date to content hash of every date already loaded
+
+    Returns:
+    reloaded: int number of reports that replaced an earlier version
+    '''
+
+    reloaded_dates = [report_date(date) for date, _ in reports if date in loaded_hashes]
+    loaded_at = datetime.utcnow()
+
+    with connection.begin() as transaction:
+        if reloaded_dates:
+            transaction.execute(delete(CovidData.__table__).where(CovidData.Date.in_(reloaded_dates)))
+            transaction.execute(delete(CovidManifest.__table__).where(CovidManifest.Date.in_(reloaded_dates)))
+            transaction.execute(delete(CovidNationalDaily.__table__).where(CovidNationalDaily.Date.in_(reloaded_dates)))
+
+        max_id = transaction.execute(select(func.max(CovidData.Id))).scalar()
+        start_id = 0 if max_id is None else max_id + 1
+
+        df = build_batch(reports, start_id)
+        bulk_insert(transaction, df, CovidData.__table__)
+        bulk_insert(transaction, national_aggregate(df), CovidNationalDaily.__table__)
+
+        transaction.execute(
+            CovidManifest.__table__.insert(),
+            [
+                {
+                    'Date': report_date(date),
+                    'Row_Count': len(tmp_df),
+                    'Content_Hash': content_hashes[date],
+                    'Loaded_At': loaded_at
+                }
+                for date, tmp_df in reports
+            ]
+        )
+
+    return len(reloaded_dates)
+
+
+def fill_database(connection, source, verify = False, batch_reports = INGEST_BATCH_REPORTS, parse_workers = PARSE_WORKERS):
+    '''
+    Compare the dates available from a data source against the manifest of loaded dates and fill in any missing records
+    With verify, every available report is read again and reports whose content changed upstream are reloaded
+    Changed reports are parsed and cleaned by parse_workers processes and written from this one batch_reports at a time,
+    so memory use doesn't grow with the number of reports, e.g. when loading every daily report
+
+    Parameters:
+    -----------
+    connection: database connection
+    source: data source from sources.py
+    verify: bool re-check reports that are already loaded
+    batch_reports: int number of reports written per transaction
+    parse_workers: int number of processes parsing reports
+
+    Returns:
+    None
+    '''
+
+    manifest = read_manifest(connection)
+    loaded_hashes = dict(zip(pd.to_datetime(manifest['Date']).dt.strftime('%m-%d-%Y'), manifest['Content_Hash']))
+
+    candidate_dates = [
+        date for date in source.available_dates()
+        if verify or (date not in loaded_hashes)
+    ]
+
+    content_hashes = {}
+
+    def changed_contents():
+        for date, content in source.read_contents(candidate_dates):
+            content_hash = hashlib.sha256(content).hexdigest()
+            if (date in loaded_hashes) and (loaded_hashes[date] == content_hash):
+                continue
+            content_hashes[date] = content_hash
+            yield date, content
+
+    filled = 0
+    reloaded = 0
+    reports = []
+    for date, tmp_df in parse_reports(changed_contents(), parse_workers):
+        reports.append((date, tmp_df))
+
+        if len(reports) >= batch_reports:
+            reloaded += write_batch(connection, reports, content_hashes, loaded_hashes)
+            filled += len(reports)
+            for written_date, _ in reports:
+                del content_hashes[written_date]
+            reports = []
+
+    if reports:
+        reloaded += write_batch(connection, reports, content_hashes, loaded_hashes)
+        filled += len(reports)
+
+    if not filled:
+        print('No new records to fill in')
+        return None
+
+    print('Filled in {} new and {} changed reports'.format(filled - reloaded, reloaded))
+    return None
+
+
+def database_updater(verify = False, source = None, parse_workers = PARSE_WORKERS):
+    '''
+    Update database
+
+    Parameters:
+    -----------
+    verify: bool re-check already loaded reports for upstream changes
+    source: data source to read reports from, the one selected by DATA_SOURCE if None
+    parse_workers: int number of processes parsing reports
+
+    Returns:
+    None
+    '''
+    
+    engine = write_engine()
+
+    migrate_database(engine)
+    db.Model.metadata.create_all(engine)
+    backfill_national_daily(engine)
+    fill_database(engine, source or data_source(), verify = verify, parse_workers = parse_workers)
+    publish_snapshot(engine)
+    publish_exports(engine)
+    print('covid_data table has been updated')
+
+    return None
+
+
+# Scheduling
+# Arbitrary key shared by every process that may run ingest
+INGEST_LOCK_KEY = 2019
+# Seconds between attempts to take the lock, and between checks that the leader still holds it
+INGEST_LOCK_RETRY = float(os.environ.get('INGEST_LOCK_RETRY', 60))
+
+
+def acquire_leader_lock(engine):
+    '''
+    Try to become the single process allowed to run ingest
+    PostgreSQL uses a session level advisory lock held by a dedicated connection
+    Other databases fall back to an exclusive lock on a local file
+
+    Parameters:
+    -----------
+    engine: database engine
+
+    Returns:
+    lock: open connection or file holding the lock, None if another process holds it
+    '''
+
+    if engine.dialect.name == 'postgresql':
+        connection = engine.connect()
+        acquired = connection.execute(
+            text('SELECT pg_try_advisory_lock(:key)'),
+            {'key': INGEST_LOCK_KEY}
+        ).scalar()
+
+        if not acquired:
+            connection.close()
+            return None
+
+        return connection
+
+    lock_file = open(os.path.join(tempfile.gettempdir(), 'covid_ingest.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+
+    return lock_file
+
+
+def leader_lock_held(lock):
+    '''
+    Check that a leader lock is still held
+    A PostgreSQL advisory lock goes away with its connection, so the connection is asked whether it still holds it
+
+    Parameters:
+    -----------
+    lock: open connection or file from acquire_leader_lock
+
+    Returns:
+    held: bool
+    '''
+
+    if not isinstance(lock, Connection):
+        return True
+
+    try:
+        held = lock.execute(
+            text(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND objid = :key "
+                "AND objsubid = 1 AND pid = pg_backend_pid() AND granted"
+            ),
+            {'key': INGEST_LOCK_KEY}
+        ).scalar()
+    except SQLAlchemyError:
+        return False
+
+    return bool(held)
+
+
+def release_leader_lock(lock):
+    '''
+    Release a leader lock by closing the connection or file holding it
+
+    Parameters:
+    -----------
+    lock: open connection or file from acquire_leader_lock
+
+    Returns:
+    None
+    '''
+
+    try:
+        lock.close()
+    except (OSError, SQLAlchemyError):
+        pass
+
+    return None
+
+
+def run_scheduler(interval, source = None, retry = INGEST_LOCK_RETRY, parse_workers = PARSE_WORKERS, verify = False):
+    '''
+    Update the database every interval seconds, forever
+    Only the process holding the leader lock runs updates, the others retry the lock every retry seconds
+    so one of them takes over soon after the leader goes away
+    The leader checks it still holds the lock before every update
+
+    Parameters:
+    -----------
+    interval: float seconds between updates
+    source: data source to read reports from, the one selected by DATA_SOURCE if None
+    retry: float seconds between lock attempts and checks
+    parse_workers: int number of processes parsing reports
+    verify: bool re-check already loaded reports for upstream changes on every update
+
+    Returns:
+    None
+    '''
+
+    lock = None
+    next_update = time.monotonic()
+
+    while True:
+        if (lock is not None) and (not leader_lock_held(lock)):
+            print('Lost the ingest leader lock')
+            release_leader_lock(lock)
+            lock = None
+
+        # A database outage or a missing DATABASE_URL must not end the loop, the lock is tried again after retry seconds
+        if lock is None:
+            try:
+                lock = acquire_leader_lock(write_engine())
+            except Exception as e:
+                print('Could not take the ingest leader lock: {}'.format(e))
+
+        if (lock is not None) and (time.monotonic() >= next_update):
+            try:
+                database_updater(verify = verify, source = source, parse_workers = parse_workers)
+            except Exception as e:
+                print('Database update failed: {}'.format(e))
+            next_update = time.monotonic() + interval
+
+        time.sleep(min(retry, max(0, next_update - time.monotonic())) if lock is not None else retry)
+
+
+def start_scheduler(interval):
+    '''
+    Run the scheduler in a daemon thread so it never blocks the web process
+    Reports are parsed in the thread, since forking worker processes from a multi-threaded web worker isn't safe
+
+    Parameters:
+    -----------
+    interval: float seconds between updates
+
+    Returns:
+    thread: threading.Thread
+    '''
+
+    thread = threading.Thread(
+        target = run_scheduler,
+        args = (interval,),
+        kwargs = {'parse_workers': 1},
+        name = 'ingest-scheduler',
+        daemon = True
+    )
+    thread.start()
+
+    return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Load new JHU daily reports into the covid_data table')
+    parser.add_argument(
+        '--schedule',
+        type = float,
+        metavar = 'SECONDS',
+        help = 'keep running and update the database every SECONDS'
+    )
+    parser.add_argument(
+        '--verify',
+        action = 'store_true',
+        help = 'download every report again and reload the ones that changed upstream, on every update with --schedule'
+    )
+    parser.add_argument(
+        '--daily',
+        action = 'store_true',
+        help = 'load every daily report instead of the 13th and 27th of each month, same as REPORT_FREQUENCY=daily'
+    )
+    parser.add_argument(
+        '--source',
+        choices = ['http', 'local', 'git'],
+        help = 'where to read reports from, defaults to DATA_SOURCE or http'
+    )
+    parser.add_argument(
+        '--source-path',
+        default = DATA_SOURCE_PATH,
+        help = 'directory of reports for --source local, path of a JHU clone for --source git'
+    )
+    parser.add_argument(
+        '--source-ref',
+        default = DATA_SOURCE_REF,
+        help = 'commit, branch or tag to read reports at for --source git'
+    )
+    args = parser.parse_args()
+
+    if ((args.source or DATA_SOURCE) in ('local', 'git')) and (not args.source_path):
+        parser.error('--source {} needs --source-path or DATA_SOURCE_PATH'.format(args.source or DATA_SOURCE))
+
+    frequency = 'daily' if args.daily else REPORT_FREQUENCY
+
+    source = None
+    if args.source or args.daily:
+        source = data_source(args.source or DATA_SOURCE, args.source_path, args.source_ref, frequency)
+
+    if args.schedule:
+        run_scheduler(args.schedule, source = source, verify = args.verify)
+    else:
+        # A one-off update takes the same lock, so it never writes alongside a scheduled one
+        lock = acquire_leader_lock(write_engine())
+        if lock is None:
+            raise SystemExit('Another process is updating the database, try again once it finishes')
+
+        try:
+            database_updater(verify = args.verify, source = source)
+        finally:
+            release_leader_lock(lock)
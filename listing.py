@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+import requests
+
+
+# Listing Settings
+GITHUB_URL = 'https://github.com/CSSEGISandData/COVID-19/tree/master/csse_covid_19_data/csse_covid_19_daily_reports_us'
+BASE_URL = 'https://github.com/CSSEGISandData/COVID-19/raw/master/csse_covid_19_data/csse_covid_19_daily_reports_us/'
+
+LISTING_PROVIDER = os.environ.get('LISTING_PROVIDER', 'github')
+LISTING_URL = os.environ.get('LISTING_URL', GITHUB_URL)
+REPORTS_BASE_URL = os.environ.get('REPORTS_BASE_URL', BASE_URL)
+LISTING_CACHE_PATH = os.environ.get('LISTING_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'covid_listing.json'))
+LISTING_TIMEOUT = float(os.environ.get('LISTING_TIMEOUT', 30))
+# Last date the generated listing enumerates, JHU published its last US daily report on 03-09-2023
+# Set it empty to enumerate up to yesterday
+LISTING_LAST_DATE = os.environ.get('LISTING_LAST_DATE', '03-09-2023')
+
+# The first US daily report is 04-12-2020, only the 13th and 27th of each month are loaded
+# unless REPORT_FREQUENCY is 'daily'
+FIRST_REPORT_DATE = date(2020, 4, 12)
+REPORT_DAYS = (13, 27)
+REPORT_FREQUENCY = os.environ.get('REPORT_FREQUENCY', 'biweekly')
+
+# Report file names, e.g. 04-13-2020.csv, wherever they appear in the listing page
+report_name_pattern = re.compile(r'(\d{2})-(\d{2})-(\d{4})\.csv')
+
+
+def report_urls(extracted_dates, base_url):
+    '''
+    Raw csv url of every report date
+
+    Parameters:
+    -----------
+    extracted_dates: list of report dates, e.g. '04-13-2020'
+    base_url: string of root raw_url
+
+    Returns:
+    raw_urls: list of raw_urls matching extracted_dates
+    '''
+
+    return [base_url + extracted_date + '.csv' for extracted_date in extracted_dates]
+
+
+def is_report_day(day, frequency = REPORT_FREQUENCY):
+    '''
+    Whether reports published on a day of the month are loaded
+
+    Parameters:
+    -----------
+    day: int day of the month
+    frequency: string 'biweekly' or 'daily'
+
+    Returns:
+    loaded: bool
+    '''
+
+    return (frequency == 'daily') or (day in REPORT_DAYS)
+
+
+def parse_listing(page_text, frequency = REPORT_FREQUENCY):
+    '''
+    Find the report dates in a listing page
+    A single regular expression over the raw page replaces building a parse tree of it
+
+    Parameters:
+    -----------
+    page_text: string of the listing page
+    frequency: string 'biweekly' for the 13th and 27th of each month, 'daily' for every report
+
+    Returns:
+    extracted_dates: sorted list of unique report dates
+    '''
+
+    extracted_dates = {
+        '{}-{}-{}'.format(month, day, year)
+        for month, day, year in report_name_pattern.findall(page_text)
+        if is_report_day(int(day), frequency)
+    }
+
+    return sorted(extracted_dates, key = lambda extracted_date: datetime.strptime(extracted_date, '%m-%d-%Y'))
+
+
+class GithubListing:
+    '''
+    Report dates scraped from the GitHub page listing the daily reports
+    Every date in the page and the page's ETag/Last-Modified are cached on disk, so an unchanged listing
+    is answered with a 304 and isn't downloaded or parsed again
+
+    Parameters:
+    -----------
+    listing_url: string of the listing page url
+    base_url: string of root raw_url
+    cache_path: string path of the cached listing manifest
+    timeout: float seconds to wait for the server
+    frequency: string 'biweekly' or 'daily'
+    '''
+
+    def __init__(self, listing_url = LISTING_URL, base_url = REPORTS_BASE_URL, cache_path = LISTING_CACHE_PATH, timeout = LISTING_TIMEOUT, frequency = REPORT_FREQUENCY):
+        self.listing_url = listing_url
+        self.base_url = base_url
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.frequency = frequency
+
+    def read_cache(self):
+        '''
+        Read the cached listing manifest, ignoring one written for another listing url
+
+        Returns:
+        cache: dict with listing_url, etag, last_modified and all_dates, None if there is none
+        '''
+
+        try:
+            with open(self.cache_path) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if (cache.get('listing_url') != self.listing_url) or ('all_dates' not in cache):
+            return None
+
+        return cache
+
+    def write_cache(self, cache):
+        '''
+        Replace the cached listing manifest
+
+        Parameters:
+        -----------
+        cache: dict with listing_url, etag, last_modified and all_dates
+
+        Returns:
+        None
+        '''
+
+        tmp_path = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(cache, file)
+        os.replace(tmp_path, self.cache_path)
+
+        return None
+
+    def reports(self):
+        '''
+        Return the available reports, revalidating the cached listing with a conditional request
+
+        Returns:
+        extracted_dates: list of all available dates
+        raw_urls: list of all available raw_urls
+        '''
+
+        cache = self.read_cache()
+
+        headers = {}
+        if cache is not None:
+            if cache.get('etag'):
+                headers['If-None-Match'] = cache['etag']
+            if cache.get('last_modified'):
+                headers['If-Modified-Since'] = cache['last_modified']
+
+        response = requests.get(self.listing_url, headers = headers, timeout = self.timeout)
+
+        if (response.status_code == 304) and (cache is not None):
+            all_dates = cache['all_dates']
+        else:
+            response.raise_for_status()
+            all_dates = parse_listing(response.text, 'daily')
+            self.write_cache({
+                'listing_url': self.listing_url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'all_dates': all_dates
+            })
+
+        extracted_dates = [
+            extracted_date for extracted_date in all_dates
+            if is_report_day(int(extracted_date[3:5]), self.frequency)
+        ]
+
+        return extracted_dates, report_urls(extracted_dates, self.base_url)
+
+
+class GeneratedListing:
+    '''
+    Report dates enumerated from the calendar without any request:
+    every 13th and 27th, or every day, from the first report up to yesterday, or up to last_date
+    Dates whose report doesn't exist upstream are skipped by ingest when the download returns 404
+
+    Parameters:
+    -----------
+    base_url: string of root raw_url
+    last_date: datetime.date of the last report to list, yesterday if None
+    frequency: string 'biweekly' or 'daily'
+    '''
+
+    def __init__(self, base_url = REPORTS_BASE_URL, last_date = None, frequency = REPORT_FREQUENCY):
+        self.base_url = base_url
+        self.last_date = last_date
+        self.frequency = frequency
+
+    def reports(self):
+        '''
+        Return the reports expected to exist by their dates
+
+        Returns:
+        extracted_dates: list of all expected dates
+        raw_urls: list of all expected raw_urls
+        '''
+
+        last_date = self.last_date or (datetime.utcnow().date() - timedelta(days = 1))
+
+        extracted_dates = []
+        report_date = FIRST_REPORT_DATE
+        while report_date <= last_date:
+            if is_report_day(report_date.day, self.frequency):
+                extracted_dates.append(report_date.strftime('%m-%d-%Y'))
+            report_date += timedelta(days = 1)
+
+        return extracted_dates, report_urls(extracted_dates, self.base_url)
+
+
+class FallbackListing:
+    '''
+    Use the first listing, and the second one when the first fails
+
+    Parameters:
+    -----------
+    listing: listing tried first
+    fallback: listing used when the first raises a request error
+    '''
+
+    def __init__(self, listing, fallback):
+        self.listing = listing
+        self.fallback = fallback
+
+    def reports(self):
+        '''
+        Returns:
+        extracted_dates: list of dates from whichever listing answered
+        raw_urls: list of raw_urls matching extracted_dates
+        '''
+
+        try:
+            return self.listing.reports()
+        except requests.RequestException as e:
+            print('Listing failed, enumerating report dates instead: {}'.format(e))
+            return self.fallback.reports()
+
+
+def listing_provider(name = LISTING_PROVIDER, frequency = REPORT_FREQUENCY):
+    '''
+    Build the listing selected by LISTING_PROVIDER
+    'github' scrapes the listing page and falls back to enumerating dates, 'generated' only enumerates
+
+    Parameters:
+    -----------
+    name: string 'github' or 'generated'
+    frequency: string 'biweekly' or 'daily'
+
+    Returns:
+    listing: object with a reports() method returning (extracted_dates, raw_urls)
+    '''
+
+    last_date = datetime.strptime(LISTING_LAST_DATE, '%m-%d-%Y').date() if LISTING_LAST_DATE else None
+    generated = GeneratedListing(last_date = last_date, frequency = frequency)
+
+    if name == 'generated':
+        return generated
+
+    return FallbackListing(GithubListing(frequency = frequency), generated)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Time fetching the report listing, cold and with the cached manifest')
+    parser.add_argument('--listing-url', default = LISTING_URL)
+    parser.add_argument('--base-url', default = REPORTS_BASE_URL)
+    parser.add_argument('--repeat', type = int, default = 5, help = 'conditional requests timed after the cold one')
+    args = parser.parse_args()
+
+    cache_path = os.path.join(tempfile.mkdtemp(), 'covid_listing.json')
+    listing = GithubListing(args.listing_url, args.base_url, cache_path)
+
+    for attempt in range(args.repeat + 1):
+        start = time.perf_counter()
+        extracted_dates, raw_urls = listing.reports()
+        print('{} {} dates in {:.1f} ms'.format('cold' if attempt == 0 else 'cached', len(extracted_dates), (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    extracted_dates, raw_urls = GeneratedListing(args.base_url).reports()
+    print('generated {} dates in {:.1f} ms'.format(len(extracted_dates), (time.perf_counter() - start) * 1000))
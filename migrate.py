@@ -0,0 +1,176 @@
+from datetime import date
+from sqlalchemy import inspect, text
+from app import CovidData, CovidNationalDaily, CovidManifest
+from database import write_engine
+
+
+# Tables in the order they are migrated
+migrated_tables = [CovidData.__table__, CovidNationalDaily.__table__, CovidManifest.__table__]
+
+
+def legacy_columns(connection, table):
+    '''
+    Find the columns of an existing table whose stored type doesn't match the model,
+    e.g. Date stored as 'MM-DD-YYYY' text or counts stored as floats
+
+    Parameters:
+    -----------
+    connection: database connection
+    table: SQLAlchemy table of the model
+
+    Returns:
+    columns: list of SQLAlchemy columns of the model, empty if the table doesn't exist yet
+    '''
+
+    inspector = inspect(connection)
+    if not inspector.has_table(table.name):
+        return []
+
+    stored_types = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+
+    columns = [
+        column for column in table.columns
+        if (column.name in stored_types) and (stored_types[column.name].python_type is not column.type.python_type)
+    ]
+
+    return columns
+
+
+def converted_column(connection, column):
+    '''
+    SQL expression converting a legacy column value to the type of the model column
+
+    Parameters:
+    -----------
+    connection: database connection
+    column: SQLAlchemy column of the model
+
+    Returns:
+    expression: string of SQL
+    '''
+
+    name = connection.dialect.identifier_preparer.quote(column.name)
+
+    if column.type.python_type is date:
+        if connection.dialect.name == 'postgresql':
+            return "to_date({}, 'MM-DD-YYYY')".format(name)
+        return "substr({0}, 7, 4) || '-' || substr({0}, 1, 2) || '-' || substr({0}, 4, 2)".format(name)
+
+    # Whole number counts that were stored as floats
+    return 'CAST(round({}) AS {})'.format(name, column.type.compile(dialect = connection.dialect))
+
+
+def remove_duplicate_rows(connection):
+    '''
+    Keep only the most recently inserted covid_data row for each state and date
+    so the unique (Province_State, Date) index can be built
+
+    Parameters:
+    -----------
+    connection: database connection
+
+    Returns:
+    removed: int number of deleted rows
+    '''
+
+    result = connection.execute(text(
+        '''
+        DELETE FROM covid_data
+        WHERE "Id" NOT IN (
+            SELECT max("Id") FROM covid_data GROUP BY "Province_State", "Date"
+        )
+        '''
+    ))
+
+    return result.rowcount
+
+
+def convert_table(connection, table, columns):
+    '''
+    Convert the legacy columns of a table in place
+    PostgreSQL alters the column types, SQLite can't so the table is rebuilt and the rows copied over
+
+    Parameters:
+    -----------
+    connection: database connection with a transaction in progress
+    table: SQLAlchemy table of the model
+    columns: list of legacy columns from legacy_columns
+
+    Returns:
+    None
+    '''
+
+    quote = connection.dialect.identifier_preparer.quote
+
+    if connection.dialect.name == 'postgresql':
+        alterations = [
+            'ALTER COLUMN {} TYPE {} USING {}'.format(
+                quote(column.name),
+                column.type.compile(dialect = connection.dialect),
+                converted_column(connection, column)
+            )
+            for column in columns
+        ]
+        connection.execute(text('ALTER TABLE {} {}'.format(quote(table.name), ', '.join(alterations))))
+
+    else:
+        legacy_name = table.name + '_legacy'
+        connection.execute(text('ALTER TABLE {} RENAME TO {}'.format(quote(table.name), quote(legacy_name))))
+        table.create(connection)
+
+        legacy_names = {column.name for column in columns}
+        connection.execute(text('INSERT INTO {} ({}) SELECT {} FROM {}'.format(
+            quote(table.name),
+            ', '.join(quote(column.name) for column in table.columns),
+            ', '.join(converted_column(connection, column) if column.name in legacy_names else quote(column.name) for column in table.columns),
+            quote(legacy_name)
+        )))
+        connection.execute(text('DROP TABLE {}'.format(quote(legacy_name))))
+
+    return None
+
+
+def migrate_database(engine):
+    '''
+    Bring tables created by earlier versions of the app up to the current models:
+    DATE columns for the report dates, integer columns for counts and the covid_data indexes
+    Tables that are already current are left alone, so this is safe to run before every ingest
+
+    Parameters:
+    -----------
+    engine: database engine
+
+    Returns:
+    None
+    '''
+
+    if engine.dialect.name not in ('postgresql', 'sqlite'):
+        print('Skipping migration, {} is not supported'.format(engine.dialect.name))
+        return None
+
+    with engine.begin() as connection:
+        for table in migrated_tables:
+            inspector = inspect(connection)
+            if not inspector.has_table(table.name):
+                continue
+
+            if table is CovidData.__table__:
+                index_names = {index['name'] for index in inspector.get_indexes(table.name)}
+                if 'ix_covid_data_state_date' not in index_names:
+                    removed = remove_duplicate_rows(connection)
+                    if removed:
+                        print('Removed {} duplicate covid_data rows'.format(removed))
+
+            columns = legacy_columns(connection, table)
+            if columns:
+                convert_table(connection, table, columns)
+                print('Migrated {}: {}'.format(table.name, ', '.join(column.name for column in columns)))
+
+            for index in table.indexes:
+                index.create(connection, checkfirst = True)
+
+    return None
+
+
+if __name__ == '__main__':
+    migrate_database(write_engine())
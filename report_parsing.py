@@ -0,0 +1,135 @@
+import io
+import os
+import time
+import argparse
+from datetime import datetime
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from data_clean.data_cleaning import excluded_states, report_dtypes
+
+
+# Parse Settings
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1))
+# Reports handed to a worker process at a time, a single report is too little work to be worth the round trip
+PARSE_CHUNK_REPORTS = int(os.environ.get('PARSE_CHUNK_REPORTS', 8))
+
+
+def report_date(date):
+    '''
+    Convert the date in a report's file name to the value stored in the Date columns
+
+    Parameters:
+    -----------
+    date: string of the report date, e.g. '04-13-2020'
+
+    Returns:
+    date: datetime.date
+    '''
+
+    return datetime.strptime(date, '%m-%d-%Y').date()
+
+
+def parse_report(date, content):
+    '''
+    Parse the raw bytes of a csv report into a cleaned dataframe tagged with its date
+    Only the columns in report_dtypes are read, older reports missing some of them get them empty
+
+    Parameters:
+    -----------
+    date: string of the report date
+    content: bytes of the raw csv
+
+    Returns:
+    tmp_df: Pandas dataframe
+    '''
+
+    tmp_df = pd.read_csv(
+        io.BytesIO(content),
+        usecols = lambda column: column in report_dtypes,
+        dtype = report_dtypes
+    )
+    tmp_df = tmp_df[~tmp_df['Province_State'].isin(excluded_states)].reset_index(drop = True)
+    tmp_df = tmp_df.reindex(columns = list(report_dtypes))
+    tmp_df['Date'] = pd.Timestamp(report_date(date))
+
+    return tmp_df
+
+
+def parse_chunk(chunk):
+    '''
+    Parse a chunk of reports in a worker process
+
+    Parameters:
+    -----------
+    chunk: list of (date, content) tuples
+
+    Returns:
+    parsed: list of (date, tmp_df) tuples
+    '''
+
+    return [(date, parse_report(date, content)) for date, content in chunk]
+
+
+def parse_reports(contents, max_workers = PARSE_WORKERS, chunk_reports = PARSE_CHUNK_REPORTS):
+    '''
+    Parse and clean raw reports in a pool of worker processes
+    Only the cleaned frames come back to the calling process, which stays the single writer
+    Chunks are submitted as finished ones are consumed, so at most 2 * max_workers chunks are in flight
+    With one worker the reports are parsed in the calling process instead
+
+    Parameters:
+    -----------
+    contents: iterable of (date, content) tuples of raw reports
+    max_workers: int number of worker processes
+    chunk_reports: int number of reports parsed per task
+
+    Returns:
+    generator of (date, tmp_df) tuples, in the order chunks finish
+    '''
+
+    if max_workers <= 1:
+        for date, content in contents:
+            yield date, parse_report(date, content)
+        return
+
+    contents = iter(contents)
+    chunks = iter(lambda: list(islice(contents, chunk_reports)), [])
+
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        futures = {executor.submit(parse_chunk, chunk) for chunk in islice(chunks, 2 * max_workers)}
+
+        while futures:
+            done, futures = wait(futures, return_when = FIRST_COMPLETED)
+
+            for future in done:
+                for chunk in islice(chunks, 1):
+                    futures.add(executor.submit(parse_chunk, chunk))
+
+                yield from future.result()
+
+
+if __name__ == '__main__':
+    from sources import data_source
+
+    parser = argparse.ArgumentParser(description = 'Time parsing and cleaning every report of a data source with more and more worker processes')
+    parser.add_argument('--source', choices = ['local', 'git'], default = 'local')
+    parser.add_argument('--source-path', required = True, help = 'directory of reports, or path of a JHU clone for --source git')
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2, 4, 8])
+    parser.add_argument('--chunk-reports', type = int, default = PARSE_CHUNK_REPORTS)
+    args = parser.parse_args()
+
+    # Reports are read once up front so only parsing is timed
+    source = data_source(args.source, args.source_path, frequency = 'daily')
+    contents = list(source.read_contents(source.available_dates()))
+    print('{} reports, {} CPUs'.format(len(contents), os.cpu_count()))
+
+    print('{:<10}{:>12}{:>14}{:>10}'.format('Workers', 'Seconds', 'Reports/s', 'Speedup'))
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        for _ in parse_reports(contents, workers, args.chunk_reports):
+            pass
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print('{:<10}{:>12.2f}{:>14.0f}{:>9.2f}x'.format(workers, elapsed, len(contents) / elapsed, baseline / elapsed))
@@ -0,0 +1,321 @@
+import os
+import time
+import subprocess
+import requests
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from listing import listing_provider, parse_listing, REPORT_FREQUENCY
+
+
+# Source Settings
+DATA_SOURCE = os.environ.get('DATA_SOURCE', 'http')
+DATA_SOURCE_PATH = os.environ.get('DATA_SOURCE_PATH')
+DATA_SOURCE_REF = os.environ.get('DATA_SOURCE_REF', 'HEAD')
+
+# Where the US daily reports live inside a checkout of the JHU repository
+REPORTS_SUBDIR = 'csse_covid_19_data/csse_covid_19_daily_reports_us'
+
+# Fetch Settings
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 8))
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 3))
+FETCH_BACKOFF = float(os.environ.get('FETCH_BACKOFF', 0.5))
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 30))
+
+
+def fetch_report(raw_url, retries = FETCH_RETRIES, backoff = FETCH_BACKOFF, timeout = FETCH_TIMEOUT):
+    '''
+    Download a single csv report
+    Failed downloads are retried with exponential backoff, a report that doesn't exist isn't
+
+    Parameters:
+    -----------
+    raw_url: string of raw csv url
+    retries: int number of retries after the first attempt
+    backoff: float seconds to wait before the first retry, doubled on every retry
+    timeout: float seconds to wait for the server before giving up on an attempt
+
+    Returns:
+    content: bytes of the raw csv, None if the report doesn't exist
+    elapsed: float seconds spent fetching the report
+    '''
+
+    start = time.perf_counter()
+
+    for attempt in range(retries + 1):
+        try:
+            response = requests.get(raw_url, timeout = timeout)
+            if response.status_code == 404:
+                return None, time.perf_counter() - start
+            response.raise_for_status()
+            content = response.content
+            break
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+    elapsed = time.perf_counter() - start
+
+    return content, elapsed
+
+
+def fetch_reports(extracted_dates, raw_urls, max_workers = FETCH_WORKERS):
+    '''
+    Download csv reports concurrently with at most max_workers requests in flight
+    Reports are yielded in the order they finish downloading, not the order they were requested
+    New downloads are only started as finished ones are consumed, so a slow consumer never has more than
+    2 * max_workers downloaded reports waiting in memory however many reports are requested
+
+    Parameters:
+    -----------
+    extracted_dates: list of dates to fetch
+    raw_urls: list of raw_urls matching extracted_dates
+    max_workers: int maximum number of concurrent downloads
+
+    Returns:
+    generator of (date, content) tuples, missing reports are left out
+    '''
+
+    requested = zip(extracted_dates, raw_urls)
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = {
+            executor.submit(fetch_report, raw_url): date
+            for date, raw_url in islice(requested, 2 * max_workers)
+        }
+
+        while futures:
+            done, _ = wait(futures, return_when = FIRST_COMPLETED)
+
+            for future in done:
+                date = futures.pop(future)
+                for next_date, next_url in islice(requested, 1):
+                    futures[executor.submit(fetch_report, next_url)] = next_date
+
+                content, elapsed = future.result()
+                if content is None:
+                    print('Skipped {}, no report was published'.format(date))
+                    continue
+                print('Fetched {} in {:.2f}s'.format(date, elapsed))
+                yield date, content
+
+
+# Data Sources
+# Every source lists its report dates with available_dates() and streams the reports for
+# some of them with read_contents(), as (date, content) tuples of the raw csv bytes
+
+
+class HttpSource:
+    '''
+    Reports downloaded concurrently from the urls of a listing
+
+    Parameters:
+    -----------
+    listing: listing provider, the one selected by LISTING_PROVIDER if None
+    max_workers: int maximum number of concurrent downloads
+    frequency: string 'biweekly' or 'daily', used when no listing is given
+    '''
+
+    def __init__(self, listing = None, max_workers = FETCH_WORKERS, frequency = REPORT_FREQUENCY):
+        self.listing = listing or listing_provider(frequency = frequency)
+        self.max_workers = max_workers
+        self._raw_urls = None
+
+    def available_dates(self):
+        '''
+        Returns:
+        extracted_dates: list of all available dates
+        '''
+
+        extracted_dates, raw_urls = self.listing.reports()
+        self._raw_urls = dict(zip(extracted_dates, raw_urls))
+
+        return extracted_dates
+
+    def read_contents(self, extracted_dates):
+        '''
+        Parameters:
+        -----------
+        extracted_dates: list of dates to read
+
+        Returns:
+        generator of (date, content) tuples
+        '''
+
+        if self._raw_urls is None:
+            self.available_dates()
+
+        raw_urls = [self._raw_urls[date] for date in extracted_dates]
+
+        yield from fetch_reports(extracted_dates, raw_urls, self.max_workers)
+
+
+class LocalDirectorySource:
+    '''
+    Reports read from a directory of MM-DD-YYYY.csv files,
+    e.g. csse_covid_19_daily_reports_us in a checkout of the JHU repository
+
+    Parameters:
+    -----------
+    path: string directory of the reports
+    frequency: string 'biweekly' or 'daily'
+    '''
+
+    def __init__(self, path, frequency = REPORT_FREQUENCY):
+        self.path = path
+        self.frequency = frequency
+
+    def available_dates(self):
+        '''
+        Returns:
+        extracted_dates: list of all available dates
+        '''
+
+        return parse_listing('\n'.join(os.listdir(self.path)), self.frequency)
+
+    def read_contents(self, extracted_dates):
+        '''
+        Parameters:
+        -----------
+        extracted_dates: list of dates to read
+
+        Returns:
+        generator of (date, content) tuples
+        '''
+
+        for date in extracted_dates:
+            try:
+                with open(os.path.join(self.path, date + '.csv'), 'rb') as file:
+                    content = file.read()
+            except FileNotFoundError:
+                print('Skipped {}, no report was published'.format(date))
+                continue
+
+            yield date, content
+
+
+class GitSource:
+    '''
+    Reports read straight from the object database of a local clone of the JHU repository
+    Nothing is checked out, blobs of the reports at ref are streamed through one git cat-file process
+
+    Parameters:
+    -----------
+    path: string path of the clone, bare or not
+    ref: string commit, branch or tag to read the reports at
+    subdir: string directory of the reports inside the repository
+    frequency: string 'biweekly' or 'daily'
+    '''
+
+    def __init__(self, path, ref = DATA_SOURCE_REF, subdir = REPORTS_SUBDIR, frequency = REPORT_FREQUENCY):
+        self.path = path
+        self.ref = ref
+        self.subdir = subdir
+        self.frequency = frequency
+        self._blobs = None
+
+    def tree(self):
+        '''
+        List the report files at ref
+
+        Returns:
+        blobs: dict of file name to blob id
+        '''
+
+        output = subprocess.run(
+            ['git', '-C', self.path, 'ls-tree', '-z', '{}:{}'.format(self.ref, self.subdir)],
+            check = True,
+            stdout = subprocess.PIPE
+        ).stdout.decode()
+
+        blobs = {}
+        for entry in output.split('\0'):
+            if not entry:
+                continue
+            info, name = entry.split('\t', 1)
+            _, object_type, object_id = info.split()
+            if object_type == 'blob':
+                blobs[name] = object_id
+
+        return blobs
+
+    def available_dates(self):
+        '''
+        Returns:
+        extracted_dates: list of all available dates
+        '''
+
+        self._blobs = self.tree()
+
+        return parse_listing('\n'.join(self._blobs), self.frequency)
+
+    def read_contents(self, extracted_dates):
+        '''
+        Parameters:
+        -----------
+        extracted_dates: list of dates to read
+
+        Returns:
+        generator of (date, content) tuples
+        '''
+
+        if self._blobs is None:
+            self.available_dates()
+
+        process = subprocess.Popen(
+            ['git', '-C', self.path, 'cat-file', '--batch'],
+            stdin = subprocess.PIPE,
+            stdout = subprocess.PIPE
+        )
+
+        try:
+            for date in extracted_dates:
+                object_id = self._blobs.get(date + '.csv')
+                if object_id is None:
+                    print('Skipped {}, no report was published'.format(date))
+                    continue
+
+                process.stdin.write(object_id.encode() + b'\n')
+                process.stdin.flush()
+
+                # Header is '<id> blob <size>', followed by the content and a newline
+                size = int(process.stdout.readline().split()[2])
+                content = process.stdout.read(size)
+                process.stdout.read(1)
+
+                yield date, content
+        finally:
+            process.stdin.close()
+            process.stdout.close()
+            process.wait()
+
+
+def data_source(name = DATA_SOURCE, path = DATA_SOURCE_PATH, ref = DATA_SOURCE_REF, frequency = REPORT_FREQUENCY):
+    '''
+    Build the data source selected by DATA_SOURCE
+    'local' and 'git' raise ValueError without a path, rather than reading the working directory
+
+    Parameters:
+    -----------
+    name: string 'http', 'local' or 'git'
+    path: string directory of the reports for 'local', path of the clone for 'git'
+    ref: string ref to read the reports at for 'git'
+    frequency: string 'biweekly' for the 13th and 27th of each month, 'daily' for every report
+
+    Returns:
+    source: object with available_dates() and read_contents(extracted_dates) methods
+    '''
+
+    if (name in ('local', 'git')) and (not path):
+        raise ValueError("The '{}' data source needs a path, set DATA_SOURCE_PATH or pass --source-path".format(name))
+
+    if name == 'local':
+        return LocalDirectorySource(path, frequency)
+    if name == 'git':
+        return GitSource(path, ref, frequency = frequency)
+
+    return HttpSource(frequency = frequency)
+
+
+if __name__ == '__main__':
+    print('This is the data sources file')
@@ -0,0 +1,112 @@
+import time
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer
+import pytest
+import requests
+from fixture_server import FixtureHandler
+from sources import fetch_report, fetch_reports
+
+
+dates = ['04-{:02d}-2020'.format(day) for day in range(12, 24)]
+
+
+class CountingHandler(FixtureHandler):
+    '''
+    FixtureHandler that holds every request for a moment, counts the requests in flight
+    and answers 503 to the first requests for the paths in failures
+    '''
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    requests = {}
+    failures = {}
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.requests[self.path] = cls.requests.get(self.path, 0) + 1
+            fail = cls.failures.get(self.path, 0) > 0
+            if fail:
+                cls.failures[self.path] -= 1
+
+        try:
+            time.sleep(0.05)
+            if fail:
+                return self.send_error(503)
+            return super().do_GET()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+
+@pytest.fixture
+def base_url(tmp_path):
+    for date in dates:
+        (tmp_path / '{}.csv'.format(date)).write_bytes('Province_State,Confirmed\nTexas,{}\n'.format(date).encode())
+
+    CountingHandler.in_flight = 0
+    CountingHandler.max_in_flight = 0
+    CountingHandler.requests = {}
+    CountingHandler.failures = {}
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(CountingHandler, directory = str(tmp_path)))
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    yield 'http://127.0.0.1:{}/'.format(server.server_port)
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_reports_bounds_concurrency(base_url):
+    raw_urls = [base_url + date + '.csv' for date in dates]
+
+    fetched = dict(fetch_reports(dates, raw_urls, max_workers = 3))
+
+    assert sorted(fetched) == dates
+    assert fetched['04-12-2020'] == b'Province_State,Confirmed\nTexas,04-12-2020\n'
+    assert 1 < CountingHandler.max_in_flight <= 3
+
+
+def test_fetch_reports_skips_missing_reports(base_url):
+    requested = dates[:3] + ['04-30-2020']
+    raw_urls = [base_url + date + '.csv' for date in requested]
+
+    fetched = dict(fetch_reports(requested, raw_urls, max_workers = 2))
+
+    assert sorted(fetched) == dates[:3]
+    assert CountingHandler.requests['/04-30-2020.csv'] == 1
+
+
+def test_fetch_report_retries_server_errors(base_url):
+    CountingHandler.failures['/04-12-2020.csv'] = 2
+
+    content, elapsed = fetch_report(base_url + '04-12-2020.csv', retries = 3, backoff = 0.01)
+
+    assert content == b'Province_State,Confirmed\nTexas,04-12-2020\n'
+    assert CountingHandler.requests['/04-12-2020.csv'] == 3
+    assert elapsed > 0
+
+
+def test_fetch_report_gives_up_after_retries(base_url):
+    CountingHandler.failures['/04-12-2020.csv'] = 5
+
+    with pytest.raises(requests.HTTPError):
+        fetch_report(base_url + '04-12-2020.csv', retries = 1, backoff = 0.01)
+
+    assert CountingHandler.requests['/04-12-2020.csv'] == 2
+
+
+def test_fetch_reports_retries_server_errors(base_url):
+    CountingHandler.failures['/04-13-2020.csv'] = 1
+    raw_urls = [base_url + date + '.csv' for date in dates[:4]]
+
+    fetched = dict(fetch_reports(dates[:4], raw_urls, max_workers = 2))
+
+    assert sorted(fetched) == dates[:4]
+    assert CountingHandler.requests['/04-13-2020.csv'] == 2
@@ -0,0 +1,83 @@
+from datetime import date
+import pytest
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.dialects import postgresql
+from app import CovidData
+from dashboard_functions import table_filter_clauses
+
+
+table = CovidData.__table__
+
+rows = [
+    {'Id': 1, 'Province_State': 'New York', 'Confirmed': 170000, 'Incident_Rate': 1.5, 'Date': date(2020, 4, 13)},
+    {'Id': 2, 'Province_State': 'New Jersey', 'Confirmed': 60000, 'Incident_Rate': 0.7, 'Date': date(2020, 4, 13)},
+    {'Id': 3, 'Province_State': 'Texas', 'Confirmed': 14000, 'Incident_Rate': 0.05, 'Date': date(2020, 4, 27)},
+]
+
+
+@pytest.fixture(scope = 'module')
+def engine():
+    engine = create_engine('sqlite://')
+    table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(table.insert(), rows)
+
+    return engine
+
+
+def matching_ids(engine, filter_query):
+    query = select(table.c.Id).where(*table_filter_clauses(filter_query)).order_by(table.c.Id)
+    with engine.connect() as connection:
+        return [row.Id for row in connection.execute(query)]
+
+
+def postgresql_sql(filter_query):
+    query = select(func.count()).select_from(table).where(*table_filter_clauses(filter_query))
+    return str(query.compile(dialect = postgresql.dialect()))
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('', [1, 2, 3]),
+    ('{Confirmed} >= 60000', [1, 2]),
+    ('{Confirmed} ge 60000', [1, 2]),
+    ('{Confirmed} i< 60000', [3]),
+    ('{Confirmed} eq 14000', [3]),
+    ('{Province_State} contains New', [1, 2]),
+    ('{Province_State} icontains new', [1, 2]),
+    ('{Province_State} i= "texas"', [3]),
+    ('{Province_State} s= Texas', [3]),
+    ('{Confirmed} contains 17', [1]),
+    ('{Incident_Rate} icontains .5', [1]),
+    ('{Date} datestartswith 2020-04-2', [3]),
+    ('{Date} > 2020-04-20', [3]),
+    ('{Province_State} contains New && {Confirmed} gt 100000', [1]),
+])
+def test_filter_matches(engine, filter_query, expected):
+    assert matching_ids(engine, filter_query) == expected
+
+
+@pytest.mark.parametrize('filter_query', [
+    '{Bogus} = 1',
+    '{Confirmed} > abc',
+    '{Date} = yesterday',
+    '{Confirmed} is blank',
+    '{Confirmed} between 1',
+    'Confirmed > 1',
+    '{Province_State} contains New && {Confirmed} foo 1',
+])
+def test_unreadable_parts_match_nothing(engine, filter_query):
+    assert matching_ids(engine, filter_query) == []
+
+
+@pytest.mark.parametrize('filter_query', [
+    '{Confirmed} contains 17',
+    '{Incident_Rate} icontains 1',
+    '{Date} datestartswith 2020',
+])
+def test_text_matches_cast_non_text_columns_on_postgresql(filter_query):
+    assert 'CAST(covid_data' in postgresql_sql(filter_query)
+
+
+def test_case_insensitive_operators_lower_text_on_postgresql():
+    assert 'lower(covid_data."Province_State")' in postgresql_sql('{Province_State} icontains new')
+    assert 'lower(' not in postgresql_sql('{Province_State} contains New')